@@ -18,6 +18,32 @@ parser.add_argument("-p", "--project",
                     help="only build a specific project (e.g. -p picojson)")
 parser.add_argument("-v", "--verbose", help="increase output verbosity",
                     action="store_true")
+parser.add_argument("--retry-failed", help="retry jobs that are known to fail",
+                    action="store_true")
+parser.add_argument("--history", help="also store every measurement in a history database (history.sqlite)",
+                    action="store_true")
+parser.add_argument("--estimate", help="only measure a representative subset of configs per file and estimate the rest",
+                    action="store_true")
+parser.add_argument("--link", type=int, default=0, metavar="N",
+                    help="also measure linking N objects that include the same file")
+parser.add_argument("--linker", help="linker for the link stage (e.g. gold or lld)")
+parser.add_argument("--cold", help="also measure compile times with the includes evicted from the page cache",
+                    action="store_true")
+parser.add_argument("--counters", help="also record instructions, cycles, and page faults (via perf if available)",
+                    action="store_true")
+parser.add_argument("--concurrency", type=int, nargs="?", const=os.cpu_count(), default=0, metavar="K",
+                    help="also measure throughput of 1, 2, 4, ... up to K simultaneous compiles (default: all cores)")
+parser.add_argument("--bypass-driver", help="also time the subcommands of the compiler driver (e.g. cc1plus, as) directly",
+                    action="store_true")
+parser.add_argument("--budget", type=float, metavar="MINUTES",
+                    help="execute missing jobs and refine cached results until the time budget is used up")
+parser.add_argument("--fetch-ttl", type=float, default=60, metavar="MINUTES",
+                    help="only fetch git repos if the last fetch is older than this (default: 60)")
+parser.add_argument("--prelude", metavar="FILE",
+                    help="code that precedes every file and the baseline (e.g. a few #includes), "
+                         "so that all metrics are marginal over it")
+parser.add_argument("--normalize", nargs="?", const="", metavar="HOST",
+                    help="normalize timings of all hosts to the calibration of HOST (default: this host)")
 
 args = parser.parse_args()
 
@@ -26,16 +52,27 @@ assert os.path.exists(args.dir), "directory must exist"
 jobs_file = os.path.join(args.dir, "jobs.json")
 data_file = os.path.join(args.dir, "compile-health-data.json")
 cache_file = os.path.join(args.dir, "job-cache.json")
+history_file = os.path.join(args.dir, "history.sqlite") if args.history else None
 
 if args.clear and os.path.exists(cache_file):
     with open(cache_file, "w") as f:
         f.write("{}")
 
+prelude = None
+if args.prelude:
+    with open(args.prelude, "r") as f:
+        prelude = f.read()
+
 # generate jobs
-scripts.generate_jobs.run(jobs_file, args.dir, args.project, args.configs, args.verbose)
+scripts.generate_jobs.run(jobs_file, args.dir, args.project, args.configs, args.verbose, fetch_ttl=args.fetch_ttl,
+                          prelude=prelude)
 
 # execute jobs
-scripts.execute_jobs.run(jobs_file, data_file, args.dir, cache_file, args.verbose)
+scripts.execute_jobs.run(jobs_file, data_file, args.dir, cache_file, args.verbose,
+                         retry_failed=args.retry_failed, history_file=history_file, estimate=args.estimate,
+                         link_objects=args.link, linker=args.linker, cold=args.cold,
+                         counters=args.counters, concurrency=args.concurrency,
+                         bypass_driver=args.bypass_driver, budget=args.budget, normalize=args.normalize)
 
 print("generated {} kB of json data".format(
     int(os.path.getsize(data_file) / 1024.)))
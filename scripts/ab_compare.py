@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# A/B mode: jobs that only differ in the version are timed interleaved (ABBA blocks in random order)
+# against a shared baseline, so that drift of the machine state affects both versions alike
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import time
+
+import scripts.execute_jobs
+
+# two-sided 95% quantiles of the t distribution (by degrees of freedom)
+t_quantiles = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def t_quantile(df):
+    # conservative: uses the next smaller tabulated degrees of freedom
+    for d in sorted(t_quantiles, reverse=True):
+        if d <= df:
+            return t_quantiles[d]
+    assert False, "at least two blocks are required"
+
+
+def pair_jobs(jobs, version_a, version_b):
+    # returns [(job a, job b)] for jobs that only differ in the version
+    def pair_key(j):
+        return (j["project"], j["name"], j["compiler"], " ".join(j["args"]))
+
+    jobs_a = {}
+    jobs_b = {}
+    for j in jobs:
+        if j["version"] == version_a:
+            jobs_a[pair_key(j)] = j
+        elif j["version"] == version_b:
+            jobs_b[pair_key(j)] = j
+    return [(jobs_a[k], jobs_b[k]) for k in jobs_a if k in jobs_b]
+
+
+def paired_difference(ds):
+    # mean and 95% confidence interval of paired differences
+    n = len(ds)
+    mean = sum(ds) / n
+    var = sum((d - mean) * (d - mean) for d in ds) / (n - 1)
+    half = t_quantile(n - 1) * math.sqrt(var / n)
+    return mean, mean - half, mean + half
+
+
+def measure_pair(ja, jb, dest_dir, blocks, rng, verbose):
+    # returns the timings (in seconds) of all blocks as (baseline, [a, a], [b, b])
+    baseline_main = os.path.join(dest_dir, "baseline.cc")
+    with open(baseline_main, "w") as f:
+        if ja.get("prelude"):
+            f.write(ja["prelude"] + "\n")
+        f.write("int main() { return 0; }\n")
+
+    def include_args(j):
+        return ["-I" + d for d in j["include_dirs"]]
+
+    def compile_command(j, name):
+        main = os.path.join(dest_dir, name + ".cc")
+        with open(main, "w") as f:
+            if j.get("prelude"):
+                f.write(j["prelude"] + "\n")
+            f.write("#include <" + j["file"] + ">\n")
+            if j.get("usage"):
+                f.write("int main() {\n" + j["usage"] + "\nreturn 0; }\n")
+            else:
+                f.write("int main() { return 0; }\n")
+        return [j["compiler"]] + j["args"] + include_args(j) + ["-c", main, "-o", os.path.join(dest_dir, name + ".o")]
+
+    cmds = {
+        # (the prelude may include headers of the project)
+        "base": [ja["compiler"]] + ja["args"] + include_args(ja) +
+                ["-c", baseline_main, "-o", os.path.join(dest_dir, "baseline.o")],
+        "a": compile_command(ja, "main_a"),
+        "b": compile_command(jb, "main_b"),
+    }
+    for c in cmds.values():
+        if verbose:
+            print('executing "{}"'.format(" ".join(c)))
+        p = subprocess.run(c, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if p.returncode != 0:
+            return None
+
+    def sample(name):
+        t0 = time.perf_counter()
+        subprocess.call(cmds[name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - t0
+
+    timings = []
+    for _ in range(blocks):
+        order = ["a", "b", "b", "a"] if rng.random() < 0.5 else ["b", "a", "a", "b"]
+        ts = {"a": [], "b": []}
+        base = sample("base")
+        for name in order:
+            ts[name].append(sample(name))
+        timings.append((base, ts["a"], ts["b"]))
+    return timings
+
+
+def run(jobs_file, dest_dir, dest_file, version_a, version_b, *, blocks=10, seed=None, verbose=False):
+    assert blocks >= 2, "at least two blocks are required"
+    rng = random.Random(seed)
+    dest_dir = os.path.abspath(dest_dir)
+
+    pairs = pair_jobs(scripts.execute_jobs.read_jobs(jobs_file), version_a, version_b)
+    print("found {} job pairs for {} vs {}".format(len(pairs), version_a, version_b))
+
+    results = []
+    for (i, (ja, jb)) in enumerate(pairs):
+        print("[{}/{}] comparing '{} {}' for file {}".format(i, len(pairs), ja["compiler_name"], ja["variant"], ja["name"]))
+        if ja["compiler_type"] != "gcc":
+            print("  .. skipped (A/B mode is only supported for gcc-style compilers)")
+            continue
+        timings = measure_pair(ja, jb, dest_dir, blocks, rng, verbose)
+        if timings is None:
+            print("  .. skipped (compilation failed)")
+            continue
+
+        # per block: mean of the two B samples minus mean of the two A samples
+        diff, lo, hi = paired_difference([sum(b) / len(b) - sum(a) / len(a) for (_, a, b) in timings])
+        base = min(t[0] for t in timings)
+        time_a = min(min(t[1]) for t in timings) - base
+        time_b = min(min(t[2]) for t in timings) - base
+        results.append({
+            "project": ja["project"],
+            "name": ja["name"],
+            "compiler_name": ja["compiler_name"],
+            "variant": ja["variant"],
+            "cpp": ja["cpp"],
+            "compile_time_a": time_a,
+            "compile_time_b": time_b,
+            "difference": diff,
+            "ci_low": lo,
+            "ci_high": hi,
+            "significant": lo > 0 or hi < 0,
+            "blocks": blocks,
+        })
+
+    results.sort(key=lambda r: -abs(r["difference"]))
+
+    print("")
+    print("compile time (over the shared baseline) of {} vs {}, with 95% confidence interval of the difference:".format(
+        version_a, version_b))
+    for r in results:
+        print("  {:>8.1f} ms -> {:>8.1f} ms: {:+7.1f} ms [{:+.1f}, {:+.1f}]{} {} '{}' ({} {} C++{})".format(
+            1000 * r["compile_time_a"], 1000 * r["compile_time_b"], 1000 * r["difference"],
+            1000 * r["ci_low"], 1000 * r["ci_high"], " *" if r["significant"] else "  ",
+            r["project"], r["name"], r["compiler_name"], r["variant"], r["cpp"]))
+    print("(* the confidence interval does not contain zero)")
+
+    if dest_file:
+        with open(dest_file, "w") as f:
+            json.dump({"version_a": version_a, "version_b": version_b, "results": results}, f, indent=4)
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare two versions of the same files via interleaved paired timings")
+    parser.add_argument("file", metavar="J", help="jobs file (e.g. jobs.json)")
+    parser.add_argument("version_a", metavar="A", help="old version")
+    parser.add_argument("version_b", metavar="B", help="new version")
+    parser.add_argument("-d", "--dir", required=True, type=str,
+                        help="temporary directory to use (e.g. /tmp)")
+    parser.add_argument("-n", "--blocks", type=int, default=10,
+                        help="number of ABBA blocks per pair (default: 10)")
+    parser.add_argument("--seed", type=int, help="seed for the random block order")
+    parser.add_argument("-o", "--json", help="write the comparison to this json file")
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    run(args.file, args.dir, args.json, args.version_a, args.version_b, blocks=args.blocks, seed=args.seed,
+        verbose=args.verbose)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
 import math
 import re
 import argparse
@@ -7,10 +8,269 @@ import os
 import sys
 import subprocess
 import platform
+import resource
+import shlex
+import shutil
 import time
 import json
 
-def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, silence_compiler_output, verbose):
+# results that only depend on the preprocessed translation unit
+# (and thus can be shared between preprocessor-equivalent configs)
+preprocessing_keys = [
+    "line_count",
+    "line_count_raw",
+    "preprocessing_time",
+    "preprocessing_time_base",
+    "preprocessing_time_samples",
+    "preprocessing_time_base_samples",
+    "preprocessing_time_dev",
+    "preprocessing_time_base_dev",
+    "token_count",
+    "identifier_count",
+    "declaration_count",
+    "template_count",
+    "longest_line",
+    "longest_line_tokens",
+]
+
+# results of the baseline with a prelude (only depend on the config and the prelude, thus measured once per run)
+prelude_baseline_keys = [
+    "preprocessing_time_base",
+    "preprocessing_time_base_dev",
+    "preprocessing_time_base_samples",
+    "compile_time_base",
+    "compile_time_base_dev",
+    "compile_time_base_samples",
+    "object_size_base",
+    "prelude_stats",
+]
+
+# maxima of the whole translation unit (not reduced by the prelude)
+prelude_absolute_keys = ["longest_line", "longest_line_tokens"]
+
+# approximate C++ tokens: identifiers/keywords (group 1), pp-numbers, string and char literals, punctuators
+token_pattern = re.compile(rb'([A-Za-z_$][A-Za-z0-9_$]*)'
+                           rb"|\.?[0-9](?:[eEpP][+-]|[A-Za-z0-9_.'])*"
+                           rb'|"(?:\\.|[^"\\\n])*"'
+                           rb"|'(?:\\.|[^'\\\n])*'"
+                           rb'|::|->\*?|\.\.\.|<<=?|>>=?|&&|\|\||\+\+|--|\.\*|[-+*/%&|^!=<>]=|\S')
+linemarker_pattern = re.compile(rb'^#.*$', re.MULTILINE)
+
+# keywords that (approximately) start a declaration
+declaration_keywords = set([b"class", b"struct", b"union", b"enum", b"typedef", b"using", b"namespace"])
+keywords = declaration_keywords | set([
+    b"alignas", b"alignof", b"asm", b"auto", b"bool", b"break", b"case", b"catch", b"char", b"char8_t", b"char16_t",
+    b"char32_t", b"concept", b"const", b"consteval", b"constexpr", b"constinit", b"const_cast", b"continue",
+    b"co_await", b"co_return", b"co_yield", b"decltype", b"default", b"delete", b"do", b"double", b"dynamic_cast",
+    b"else", b"explicit", b"export", b"extern", b"false", b"float", b"for", b"friend", b"goto", b"if", b"inline",
+    b"int", b"long", b"mutable", b"new", b"noexcept", b"nullptr", b"operator", b"private", b"protected", b"public",
+    b"register", b"reinterpret_cast", b"requires", b"return", b"short", b"signed", b"sizeof", b"static",
+    b"static_assert", b"static_cast", b"switch", b"template", b"this", b"thread_local", b"throw", b"true", b"try",
+    b"typeid", b"typename", b"unsigned", b"virtual", b"void", b"volatile", b"wchar_t", b"while",
+])
+
+
+def timing_stats(ts):
+    # minimum as estimate, median absolute deviation as (robust) dispersion
+    ts = sorted(ts)
+    median = ts[len(ts) // 2]
+    devs = sorted(abs(t - median) for t in ts)
+    return ts[0], devs[len(devs) // 2]
+
+
+def token_stats(path, chunk_size=1 << 20):
+    # streams the preprocessed output in chunks of complete lines (bounded memory, except for a single huge line)
+    stats = {
+        "token_count": 0,
+        "identifier_count": 0,
+        "declaration_count": 0,
+        "template_count": 0,
+        "longest_line": 0,
+        "longest_line_tokens": 0,
+    }
+
+    def process(part):
+        part = linemarker_pattern.sub(b"", part)
+        for l in part.split(b"\n"):
+            if len(l) > stats["longest_line"]:
+                stats["longest_line"] = len(l)
+                stats["longest_line_tokens"] = len(token_pattern.findall(l))
+        for ident in token_pattern.findall(part):
+            stats["token_count"] += 1
+            if not ident:
+                continue
+            if ident not in keywords:
+                stats["identifier_count"] += 1
+            elif ident in declaration_keywords:
+                stats["declaration_count"] += 1
+            elif ident == b"template":
+                stats["template_count"] += 1
+
+    with open(path, "rb") as f:
+        rest = b""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf = rest + chunk
+            end = buf.rfind(b"\n")
+            if end < 0 and len(buf) < 16 * chunk_size:
+                rest = buf
+                continue
+            if end < 0:
+                end = len(buf) - 1  # split inside an overlong line (only approximate there)
+            process(buf[:end + 1])
+            rest = buf[end + 1:]
+        process(rest)
+    return stats
+
+
+def parse_depfile(content):
+    # make-style rules, e.g. "main.o: main.cc foo.h \
+    #  bar.h" (spaces in paths are escaped)
+    content = content.replace("\\\n", " ").replace("\\ ", "\0")
+    deps = []
+    for l in content.splitlines():
+        if ":" not in l:
+            continue
+        (_, _, rhs) = l.partition(": ")
+        for d in rhs.split():
+            deps.append(d.replace("\0", " "))
+    return deps
+
+
+def include_closure(file, include_dirs, directory, compiler, compiler_type, compiler_args):
+    # returns the absolute paths of all files (transitively) included by "#include <file>"
+    assert compiler_type == 'gcc', "include closure is only supported for gcc-style compilers"
+    closure_main = os.path.join(directory, "closure.cc")
+    with open(closure_main, "w") as f:
+        f.write("#include <" + file + ">\n")
+    cargs = list(compiler_args)
+    for d in include_dirs or []:
+        cargs += ["-I" + d]
+    p = subprocess.run([compiler] + cargs + ["-M", closure_main], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.stdout.decode("utf-8", errors="replace")
+    if p.returncode != 0:
+        raise CompileError([compiler] + cargs + ["-M", closure_main], output)
+    return [os.path.abspath(d) for d in parse_depfile(output)[1:]]
+
+
+class CompileError(Exception):
+    def __init__(self, command, diagnostics):
+        super().__init__("compilation failed: " + " ".join(command))
+        self.command = command
+        self.diagnostics = diagnostics
+
+
+def evict_from_page_cache(paths):
+    # drops the (clean) cached pages of the files so that the next read has to hit the disk
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+# hardware counters that are recorded with perf stat (if available)
+perf_events = {
+    "instructions": "instructions:u",
+    "cycles": "cycles:u",
+    "page_faults": "page-faults:u",
+}
+
+
+def perf_counters(sargs, directory):
+    # returns the counters of a single run of sargs
+    # counters that are not accessible (no perf, perf_event_paranoid, no PMU in VMs) are omitted,
+    # page faults fall back to the rusage of the child process
+    counters = {}
+    perf = shutil.which("perf")
+    perf_out = os.path.join(directory, "perf.csv")
+    if perf is not None:
+        cmd = [perf, "stat", "-x", ",", "-o", perf_out, "-e", ",".join(perf_events.values()), "--"] + sargs
+        if subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
+            with open(perf_out) as f:
+                for l in f.readlines():
+                    parts = l.strip().split(",")
+                    if len(parts) < 3 or not parts[0].isdigit():
+                        continue  # comments, <not supported>, <not counted>
+                    for (name, event) in perf_events.items():
+                        if parts[2] == event:
+                            counters[name] = int(parts[0])
+
+    if "page_faults" not in counters:
+        r0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        subprocess.call(sargs, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        r1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        counters["page_faults"] = (r1.ru_minflt - r0.ru_minflt) + (r1.ru_majflt - r0.ru_majflt)
+    return counters
+
+
+def concurrency_levels(max_jobs):
+    # 1, 2, 4, ... up to max_jobs (inclusive)
+    levels = []
+    k = 1
+    while k < max_jobs:
+        levels.append(k)
+        k *= 2
+    levels.append(max_jobs)
+    return levels
+
+
+def driver_commands(sargs, tmp_prefix):
+    # returns the subcommands that the compiler driver would execute (via -###)
+    # e.g. cc1plus and as for gcc, clang -cc1 for clang
+    p = subprocess.run(sargs + ["-###"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.stdout.decode("utf-8", errors="replace")
+    if p.returncode != 0:
+        raise CompileError(sargs + ["-###"], output)
+
+    # commands are indented, other lines are version info or environment (clang also prints " (in-process)")
+    cmds = [shlex.split(l) for l in output.splitlines() if l.startswith(" ") and not l.startswith(" (")]
+    assert cmds, "could not find subcommands in output of -###"
+
+    # temporary files of the driver (outputs of all but the last step) are replaced by stable ones
+    temps = {}
+    for c in cmds[:-1]:
+        if "-o" in c:
+            t = c[c.index("-o") + 1]
+            temps[t] = tmp_prefix + os.path.splitext(t)[-1]
+    for c in cmds:
+        c[:] = [temps.get(a, a) for a in c]
+        if not os.path.isabs(c[0]):
+            prog = shutil.which(c[0])
+            assert prog is not None, "cannot find subcommand " + c[0]
+            c[0] = prog
+    return cmds
+
+
+def driver_stage(cmd):
+    # "frontend" (including code generation), "assembler", or "other"
+    prog = os.path.basename(cmd[0])
+    if "-cc1as" in cmd or prog in ["as", "gas"] or prog.endswith("-as"):
+        return "assembler"
+    if "-cc1" in cmd or prog.startswith("cc1"):
+        return "frontend"
+    return "other"
+
+
+def weak_symbols(path):
+    # returns (count, size) of weak (e.g. inline or template) symbols
+    cnt = 0
+    size = 0
+    prog = re.compile(r'^[0-9a-zA-Z]* ([0-9a-zA-Z]*) *(\w) (.+)$')
+    for l in subprocess.check_output(["nm", "-S", path]).decode("utf-8").splitlines():
+        m = prog.match(l)
+        if m is not None and m.group(2) in ['w', 'W', 'v', 'V', 'u']:
+            cnt += 1
+            size += 0 if m.group(1) == "" else int(m.group(1), base=16)
+    return cnt, size
+
+
+def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, silence_compiler_output, verbose, *,
+        preprocessing=None, usage=None, link_objects=0, linker=None, link_usage=None, cold=False, cold_samples=5,
+        counters=False, concurrency=0, concurrency_rounds=3, bypass_driver=False, prelude=None, prelude_baseline=None):
 
     is_windows = any(platform.win32_ver())
     is_linux = not is_windows
@@ -29,6 +289,15 @@ def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, s
         if verbose:
             print('executing "{}"'.format(' '.join(a)))
 
+    def run_checked(a):
+        debug_print_exec(a)
+        p = subprocess.run(a, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = p.stdout.decode("utf-8", errors="replace")
+        if not silence_compiler_output:
+            sys.stdout.write(output)
+        if p.returncode != 0:
+            raise CompileError(a, output)
+
     # ============================================================
     # Parse args
 
@@ -52,7 +321,7 @@ def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, s
     assert os.path.exists(tmp_dir), "tmp dir does not exist"
     tmp_dir = os.path.abspath(tmp_dir)
 
-    cargs = compiler_args
+    cargs = list(compiler_args)
     # cargs += ["-nostdinc"]
     debug_print("{} additional arguments".format(len(cargs)))
     for a in cargs:
@@ -64,6 +333,13 @@ def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, s
 
     file_main = os.path.join(tmp_dir, "main.cc")
     baseline_main = os.path.join(tmp_dir, "baseline.cc")
+    if prelude is not None:
+        # the file name ends up in strings, symbols, and debug info, which must cancel out with the prelude baseline
+        file_main = os.path.join(tmp_dir, "tu_main", "main.cc")
+        baseline_main = os.path.join(tmp_dir, "tu_base", "main.cc")
+        for d in [os.path.dirname(file_main), os.path.dirname(baseline_main)]:
+            if not os.path.exists(d):
+                os.makedirs(d)
     output_main = os.path.join(tmp_dir, "main.o")
     result = {}
     
@@ -109,173 +385,441 @@ def run(file, include_dirs, directory, compiler, compiler_type, compiler_args, s
     # ============================================================
     # Create temporary files to compile
 
+    # usage snippets are placed in main (to measure instantiation cost)
+    # a prelude precedes both the file and the baseline, so that all metrics are marginal over it
     with open(file_main, "w") as f:
-        f.writelines([
-            "#include <" + file + ">\n",
-            "int main() { return 0; }\n"
-        ])
+        if prelude is not None:
+            f.write(prelude + "\n")
+        if usage is None:
+            f.writelines([
+                "#include <" + file + ">\n",
+                "int main() { return 0; }\n"
+            ])
+        else:
+            f.writelines([
+                "#include <" + file + ">\n",
+                "int main() {\n",
+                usage + "\n",
+                "return 0; }\n"
+            ])
+    main_lines = 1 if usage is None else 2
 
     with open(baseline_main, "w") as f:
+        if prelude is not None:
+            f.write(prelude + "\n")
         f.writelines([
             "int main() { return 0; }\n"
         ])
 
+    # stats of the baseline with the prelude (subtracted from the stats of the file)
+    prelude_stats = {}
+    if prelude_baseline is not None:
+        prelude_stats.update(prelude_baseline["prelude_stats"])
+
+    def subtract_prelude(stats):
+        for k in stats:
+            if k not in prelude_absolute_keys:
+                result[k] -= stats[k]
+
 
     # ============================================================
     # Check stats
 
-    # -E is preprocessor only (and strips comments)
-    debug_print_exec(preproc_args)
-    subprocess.run(preproc_args, stdout=compile_out, stderr=compile_out, check=True)
-    with open(output_main) as f:
-        line_cnt_raw = 0
-        line_cnt = 0
-        prog = re.compile(r'[a-zA-Z0-9_]')
-        for l in f.readlines():
-            line_cnt_raw += 1
-
-            if prog.search(l) is not None:
-                line_cnt += 1
-        result["line_count_raw"] = line_cnt_raw - 2  # int main() + #include
-        result["line_count"] = line_cnt - 1  # int main()
+    def preprocessed_stats(path, include_lines, main_lines):
+        with open(path) as f:
+            line_cnt_raw = 0
+            line_cnt = 0
+            prog = re.compile(r'[a-zA-Z0-9_]')
+            for l in f.readlines():
+                line_cnt_raw += 1
+
+                if prog.search(l) is not None:
+                    line_cnt += 1
+        stats = {
+            "line_count_raw": line_cnt_raw - include_lines - main_lines,  # int main() + #include
+            "line_count": line_cnt - main_lines,  # int main()
+        }
+        # (including the few tokens of main)
+        stats.update(token_stats(path))
+        return stats
+
+    if preprocessing is None:
+        # -E is preprocessor only (and strips comments)
+        run_checked(preproc_args)
+        result.update(preprocessed_stats(output_main, 1, main_lines))
+        if prelude is not None:
+            if "line_count" not in prelude_stats:
+                run_checked(preproc_baseline_args)
+                prelude_stats.update(preprocessed_stats(output_main, 0, 1))
+            subtract_prelude({k: prelude_stats[k] for k in preprocessing_keys if k in prelude_stats})
+    else:
+        debug_print("reusing preprocessing results of an equivalent config")
+        for k in preprocessing_keys:
+            if k in preprocessing:
+                result[k] = preprocessing[k]
+
+    def object_stats():
+        # symbols, strings, and sections of output_main
+        stats = {}
+
+        # check symbols
+        prog = re.compile(r'^[0-9a-zA-Z]* ([0-9a-zA-Z]*) *(\w) (.+)$')
+        undef_sym_cnt = 0
+        undef_sym_size = 0
+        data_sym_cnt = 0
+        data_sym_size = 0
+        code_sym_cnt = 0
+        code_sym_size = 0
+        weak_sym_cnt = 0
+        weak_sym_size = 0
+        debug_sym_cnt = 0
+        debug_sym_size = 0
+        sym_name_size = 0
+        if is_windows:
+            assert True, "Windows not supported yet"
+            # TODO: Implement this
+            # debug_print_exec(['dumpbin.exe', output_main])
+            # for l in subprocess.check_output(['dumpbin.exe', '/SYMBOLS', '/MAP', output_main], stderr=null_out).decode("utf-8").splitlines():
+        else:
+            debug_print_exec(["nm", output_main])
+            for l in subprocess.check_output(["nm", "-a", "-S", output_main]).decode("utf-8").splitlines():
+                m = prog.match(l)
+                assert m is not None, "could not parse line " + l
+                ss = m.group(1)
+                st = m.group(2)
+                sn = m.group(3)
+                ss = 0 if ss == "" else int(ss, base=16)
+
+                if sn == "main":
+                    continue
+
+                # debug_print("symbol {}, {}, {}".format(ss,st,sn))
+
+                if st in ['U']:
+                    undef_sym_cnt += 1
+                    undef_sym_size += ss
+                    sym_name_size += len(sn)
+                elif st in ['b', 'B', 'r', 'R', 'd', 'D', 'n', 'g', 'G']:
+                    data_sym_cnt += 1
+                    data_sym_size += ss
+                    sym_name_size += len(sn)
+                elif st in ['t', 'T']:
+                    code_sym_cnt += 1
+                    code_sym_size += ss
+                    sym_name_size += len(sn)
+                elif st in ['w', 'W', 'v', 'V', 'u']:
+                    weak_sym_cnt += 1
+                    weak_sym_size += ss
+                    sym_name_size += len(sn)
+                elif st in ['N', 'a']:
+                    debug_sym_cnt += 1
+                    debug_sym_size += ss
+                    sym_name_size += len(sn)
+                else:
+                    assert False, "unknown symbol type " + st
+
+        stats["undefined_symbol_count"] = undef_sym_cnt
+        stats["undefined_symbol_size"] = undef_sym_size
+        stats["data_symbol_count"] = data_sym_cnt
+        stats["data_symbol_size"] = data_sym_size
+        stats["code_symbol_count"] = code_sym_cnt
+        stats["code_symbol_size"] = code_sym_size
+        stats["weak_symbol_count"] = weak_sym_cnt
+        stats["weak_symbol_size"] = weak_sym_size
+        stats["debug_symbol_count"] = debug_sym_cnt
+        stats["debug_symbol_size"] = debug_sym_size
+        stats["symbol_name_size"] = sym_name_size
+
+        # strings
+        string_cnt = 0
+        string_size = 0
+        if is_windows:
+            assert True, "Windows not supported yet"
+            # TODO: Implement this
+        else:
+            for l in subprocess.check_output(["strings", output_main]).decode("utf-8").splitlines():
+                string_cnt += 1
+                string_size += len(l)
+        stats["string_count"] = string_cnt
+        stats["string_size"] = string_size
+
+        # section sizes
+        if is_windows:
+            # TODO: Implement this
+        
+            stats["text_size"] = 0
+            stats["data_size"] = 0
+            stats["bss_size"] = 0
+        else:
+            for l in subprocess.check_output(["size", "-B", output_main]).decode("utf-8").splitlines():
+                if "main.o" in l:
+                    parts = l.split()
+                    stats["text_size"] = int(parts[0])
+                    stats["data_size"] = int(parts[1])
+                    stats["bss_size"] = int(parts[2])
+        return stats
 
     # -c compiles to object file
-    debug_print_exec(compile_args)
-    subprocess.run(compile_args, stdout=compile_out, stderr=compile_out, check=True)
+    run_checked(compile_args)
     result["object_size"] = os.path.getsize(output_main)
+    result.update(object_stats())
 
-    # check symbols
-    prog = re.compile(r'^[0-9a-zA-Z]* ([0-9a-zA-Z]*) *(\w) (.+)$')
-    undef_sym_cnt = 0
-    undef_sym_size = 0
-    data_sym_cnt = 0
-    data_sym_size = 0
-    code_sym_cnt = 0
-    code_sym_size = 0
-    weak_sym_cnt = 0
-    weak_sym_size = 0
-    debug_sym_cnt = 0
-    debug_sym_size = 0
-    sym_name_size = 0
-    if is_windows:
-        assert True, "Windows not supported yet"
-        # TODO: Implement this
-        # debug_print_exec(['dumpbin.exe', output_main])
-        # for l in subprocess.check_output(['dumpbin.exe', '/SYMBOLS', '/MAP', output_main], stderr=null_out).decode("utf-8").splitlines():
-    else:
-        debug_print_exec(["nm", output_main])
-        for l in subprocess.check_output(["nm", "-a", "-S", output_main]).decode("utf-8").splitlines():
-            m = prog.match(l)
-            assert m is not None, "could not parse line " + l
-            ss = m.group(1)
-            st = m.group(2)
-            sn = m.group(3)
-            ss = 0 if ss == "" else int(ss, base=16)
-
-            if sn == "main":
-                continue
-
-            # debug_print("symbol {}, {}, {}".format(ss,st,sn))
-
-            if st in ['U']:
-                undef_sym_cnt += 1
-                undef_sym_size += ss
-                sym_name_size += len(sn)
-            elif st in ['b', 'B', 'r', 'R', 'd', 'D', 'n', 'g', 'G']:
-                data_sym_cnt += 1
-                data_sym_size += ss
-                sym_name_size += len(sn)
-            elif st in ['t', 'T']:
-                code_sym_cnt += 1
-                code_sym_size += ss
-                sym_name_size += len(sn)
-            elif st in ['w', 'W', 'v', 'V', 'u']:
-                weak_sym_cnt += 1
-                weak_sym_size += ss
-                sym_name_size += len(sn)
-            elif st in ['N', 'a']:
-                debug_sym_cnt += 1
-                debug_sym_size += ss
-                sym_name_size += len(sn)
-            else:
-                assert False, "unknown symbol type " + st
-
-    result["undefined_symbol_count"] = undef_sym_cnt
-    result["undefined_symbol_size"] = undef_sym_size
-    result["data_symbol_count"] = data_sym_cnt
-    result["data_symbol_size"] = data_sym_size
-    result["code_symbol_count"] = code_sym_cnt
-    result["code_symbol_size"] = code_sym_size
-    result["weak_symbol_count"] = weak_sym_cnt
-    result["weak_symbol_size"] = weak_sym_size
-    result["debug_symbol_count"] = debug_sym_cnt
-    result["debug_symbol_size"] = debug_sym_size
-    result["symbol_name_size"] = sym_name_size
-
-    # strings (BEFORE baseline!)
-    string_cnt = 0
-    string_size = 0
     if is_windows:
-        assert True, "Windows not supported yet"
-        # TODO: Implement this
-    else:
-        for l in subprocess.check_output(["strings", output_main]).decode("utf-8").splitlines():
-            string_cnt += 1
-            string_size += len(l)
-    result["string_count"] = string_cnt
-    result["string_size"] = string_size
-
-    # section sizes (BEFORE baseline!)
-    if is_windows:
-        # TODO: Implement this
-        
-        result["text_size"] = 0
-        result["data_size"] = 0
-        result["bss_size"] = 0
-
         result["object_size_base"] = 0
+    elif prelude_baseline is not None:
+        result["object_size_base"] = prelude_baseline["object_size_base"]
     else:
-        for l in subprocess.check_output(["size", "-B", output_main]).decode("utf-8").splitlines():
-            if "main.o" in l:
-                parts = l.split()
-                result["text_size"] = int(parts[0])
-                result["data_size"] = int(parts[1])
-                result["bss_size"] = int(parts[2])
-
         # baseline object size
-        debug_print_exec(compile_baseline_args)
-        subprocess.run(compile_baseline_args, stdout=compile_out, stderr=compile_out, check=True)
+        run_checked(compile_baseline_args)
         result["object_size_base"] = os.path.getsize(output_main)
+        if prelude is not None:
+            prelude_stats.update(object_stats())
+    if prelude is not None:
+        subtract_prelude({k: prelude_stats[k] for k in prelude_stats if k not in preprocessing_keys})
+        result["prelude_stats"] = prelude_stats
 
 
     # ============================================================
     # Check parse and compile times
 
+    def enough_samples(ts):
+        if len(ts) > 10:
+            return True
+        if len(ts) >= 8:
+            if ts[3] / ts[0] < 1.01:  # cheapest 4 deviate less than 1%
+                return True
+        # long compilations do not need many repetitions
+        return len(ts) >= 3 and ts[0] > 0.5
+
     def measure_time(sargs):
         ts = []
-        while True:
-            if len(ts) > 10:
-                break
-            if len(ts) >= 8:
-                if ts[3] / ts[0] < 1.01:  # cheapest 4 deviate less than 1%
-                    break
-            # long compilations do not need many repetitions
-            if len(ts) >= 3 and ts[0] > 0.5:
-                break
-
+        while not enough_samples(ts):
             t0 = time.perf_counter()
             subprocess.call(sargs, stdout=compile_out, stderr=compile_out)
             t1 = time.perf_counter()
             ts.append(t1 - t0)
             ts.sort()
 
-        return ts[0]
+        return ts
+
+    def measure_interleaved(cmds):
+        # one sample of every command per round, so that all of them see the same machine state
+        samples = [[] for _ in cmds]
+        while not enough_samples(samples[0]):
+            for (sargs, ts) in zip(cmds, samples):
+                t0 = time.perf_counter()
+                subprocess.call(sargs, stdout=compile_out, stderr=compile_out)
+                t1 = time.perf_counter()
+                ts.append(t1 - t0)
+                ts.sort()
+        return samples
+
+    def timed_call(sargs):
+        subprocess.call(sargs, stdout=compile_out, stderr=compile_out)
+        return time.perf_counter()
+
+    def add_timing(name, sargs):
+        ts = measure_time(sargs)
+        result[name], result[name + "_dev"] = timing_stats(ts)
+        result[name + "_samples"] = ts
+
+
+    if prelude_baseline is not None:
+        debug_print("reusing the prelude baseline of this config")
+        for k in prelude_baseline_keys:
+            if k in prelude_baseline and k not in result:
+                result[k] = prelude_baseline[k]
+    else:
+        if preprocessing is None:
+            add_timing("preprocessing_time_base", preproc_baseline_args)
+        add_timing("compile_time_base", compile_baseline_args)
+    if preprocessing is None:
+        add_timing("preprocessing_time", preproc_args)
+    add_timing("compile_time", compile_args)
+
+
+    # ============================================================
+    # Driver bypass (optional)
+    # times the subcommands of the driver directly, the rest of the driver time is driver overhead
+    # (the driver is timed again interleaved with its subcommands, compile_time stems from a separate pass)
+
+    if bypass_driver:
+        assert compiler_type == 'gcc', "driver bypass is only supported for gcc-style compilers"
+        for (suffix, sargs, prefix) in [("_base", compile_baseline_args, "driver_baseline"),
+                                        ("", compile_args, "driver_main")]:
+            cmds = driver_commands(sargs, os.path.join(tmp_dir, prefix))
+            for cmd in cmds:
+                run_checked(cmd)  # creates the inputs of the next step
+            samples = measure_interleaved([sargs] + cmds)
+            (driver_time, _) = timing_stats(samples[0])
+            total = 0
+            for stage in ["frontend", "assembler", "other"]:
+                stage_samples = [ts for (cmd, ts) in zip(cmds, samples[1:]) if driver_stage(cmd) == stage]
+                if not stage_samples:
+                    continue
+                name = stage + "_time" + suffix
+                result[name] = 0
+                result[name + "_dev"] = 0
+                for ts in stage_samples:
+                    (t, dev) = timing_stats(ts)
+                    result[name] += t
+                    result[name + "_dev"] += dev
+                total += result[name]
+            # the minima of driver and subcommands can still stem from different rounds
+            overhead = driver_time - total
+            result["driver_overhead" + suffix] = max(overhead, 0)
+            if overhead < 0:
+                result["driver_overhead" + suffix + "_noisy"] = True
+
+
+    # ============================================================
+    # Hardware counters (optional)
+    # far less noisy than wall-clock time for comparing versions
+
+    if counters:
+        for (name, sargs) in [("compile_{}_base", compile_baseline_args), ("compile_{}", compile_args)]:
+            for (k, v) in perf_counters(sargs, tmp_dir).items():
+                result[name.format(k)] = v
+
+
+    # ============================================================
+    # Concurrency scaling (optional)
+    # K copies of the same compilation run simultaneously (as in a parallel build)
+
+    if concurrency > 0:
+        assert compiler_type == 'gcc', "concurrency scaling is only supported for gcc-style compilers"
+        scaling = []
+        for k in concurrency_levels(concurrency):
+            cmds = [[compiler] + cargs + ["-c", file_main, "-o", os.path.join(tmp_dir, "main_{}.o".format(i))]
+                    for i in range(k)]
+            best = None
+            for _ in range(concurrency_rounds):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=k) as executor:
+                    t0 = time.perf_counter()
+                    latencies = list(executor.map(lambda c: timed_call(c) - t0, cmds))
+                makespan = max(latencies)
+                if best is None or makespan < best[0]:
+                    best = (makespan, sorted(latencies))
+            (makespan, latencies) = best
+            scaling.append({
+                "jobs": k,
+                "makespan": makespan,
+                "latency": latencies[len(latencies) // 2],
+                "throughput": k / makespan,
+            })
+        for sc in scaling:
+            # 1.0 means perfect scaling, i.e. K times the throughput of a single compile
+            sc["efficiency"] = sc["throughput"] / (sc["jobs"] * scaling[0]["throughput"])
+        result["concurrency_scaling"] = scaling
+
+
+    # ============================================================
+    # Cold file-cache timings (optional)
+    # the include closure is evicted from the page cache before every sample
+
+    if cold:
+        assert hasattr(os, "posix_fadvise"), "cold timings require posix_fadvise"
+        closure = include_closure(file, include_dirs, tmp_dir, compiler, compiler_type, compiler_args)
+        result["include_closure_size"] = sum(os.path.getsize(f) for f in closure)
+
+        ts = []
+        bytes_read = []
+        for _ in range(cold_samples):
+            evict_from_page_cache(closure)
+            # ru_inblock counts 512 byte blocks read by (waited-for) child processes
+            b0 = resource.getrusage(resource.RUSAGE_CHILDREN).ru_inblock
+            t0 = time.perf_counter()
+            subprocess.call(compile_args, stdout=compile_out, stderr=compile_out)
+            t1 = time.perf_counter()
+            b1 = resource.getrusage(resource.RUSAGE_CHILDREN).ru_inblock
+            ts.append(t1 - t0)
+            bytes_read.append(512 * (b1 - b0))
+        ts.sort()
+        bytes_read.sort()
+        result["compile_time_cold"], result["compile_time_cold_dev"] = timing_stats(ts)
+        result["compile_time_cold_samples"] = ts
+        result["bytes_read_cold"] = bytes_read[len(bytes_read) // 2]
 
 
-    result["preprocessing_time_base"] = measure_time(preproc_baseline_args)
-    result["compile_time_base"] = measure_time(compile_baseline_args)
-    result["preprocessing_time"] = measure_time(preproc_args)
-    result["compile_time"] = measure_time(compile_args)
+    # ============================================================
+    # Link stage (optional)
+    # links N objects that all include the file (and use it if link_usage is given)
+
+    if link_objects > 0:
+        assert compiler_type == 'gcc', "link stage is only supported for gcc-style compilers"
+        result["link_config"] = {"objects": link_objects, "linker": linker, "usage": link_usage}
+
+        link_dir = os.path.join(tmp_dir, "link")
+        if not os.path.exists(link_dir):
+            os.makedirs(link_dir)
+
+        link_args = list(cargs)
+        if linker is not None:
+            link_args.append("-fuse-ld=" + linker)
+
+        link_main = os.path.join(link_dir, "main.cc")
+        with open(link_main, "w") as f:
+            for i in range(link_objects):
+                f.write("int link_use_{}();\n".format(i))
+            f.write("int main() {{ return {}; }}\n".format(
+                " + ".join("link_use_{}()".format(i) for i in range(link_objects))))
+
+        def build_link_command(name, include):
+            objs = []
+            for i in range(link_objects):
+                src = os.path.join(link_dir, "{}_{}.cc".format(name, i))
+                with open(src, "w") as f:
+                    if prelude is not None:
+                        f.write(prelude + "\n")
+                    if include:
+                        f.write("#include <" + file + ">\n")
+                    f.write("int link_use_{}() {{\n".format(i))
+                    if include and link_usage:
+                        f.write(link_usage + "\n")
+                    f.write("    return 0;\n}\n")
+                obj = os.path.join(link_dir, "{}_{}.o".format(name, i))
+                run_checked([compiler] + cargs + ["-c", src, "-o", obj])
+                objs.append(obj)
+            obj = os.path.join(link_dir, "{}_main.o".format(name))
+            run_checked([compiler] + cargs + ["-c", link_main, "-o", obj])
+            objs.append(obj)
+            return objs, [compiler] + link_args + objs + ["-o", os.path.join(link_dir, name)]
+
+        try:
+            (objs, link_cmd) = build_link_command("link", True)
+            (_, link_baseline_cmd) = build_link_command("link_base", False)
+
+            run_checked(link_cmd)
+            run_checked(link_baseline_cmd)
+            result["binary_size"] = os.path.getsize(link_cmd[-1])
+            result["binary_size_base"] = os.path.getsize(link_baseline_cmd[-1])
+
+            # duplicated weak symbols are eliminated by the linker
+            obj_weak_cnt = 0
+            obj_weak_size = 0
+            for o in objs:
+                (c, sz) = weak_symbols(o)
+                obj_weak_cnt += c
+                obj_weak_size += sz
+            # (minus weak symbols of the runtime that are already in the baseline binary)
+            (bin_weak_cnt, bin_weak_size) = weak_symbols(link_cmd[-1])
+            (base_weak_cnt, base_weak_size) = weak_symbols(link_baseline_cmd[-1])
+            bin_weak_cnt -= base_weak_cnt
+            bin_weak_size -= base_weak_size
+            result["link_weak_symbol_count_objects"] = obj_weak_cnt
+            result["link_weak_symbol_size_objects"] = obj_weak_size
+            result["link_weak_symbol_count_binary"] = bin_weak_cnt
+            result["link_weak_symbol_size_binary"] = bin_weak_size
+            result["link_eliminated_symbol_count"] = obj_weak_cnt - bin_weak_cnt
+            result["link_eliminated_symbol_size"] = obj_weak_size - bin_weak_size
+
+            add_timing("link_time_base", link_baseline_cmd)
+            add_timing("link_time", link_cmd)
+        except CompileError as e:
+            # the compile results are still valid if only linking fails (e.g. non-header-only libraries)
+            errors = [l for l in e.diagnostics.splitlines() if "error" in l]
+            result["link_error"] = errors[0] if errors else "link stage failed"
+            debug_print("link stage failed: " + result["link_error"])
 
 
     # ============================================================
@@ -300,6 +844,10 @@ if __name__ == '__main__':
                         help="temporary directory to use (e.g. /tmp)")
     parser.add_argument(
         "args", type=str, help="additional compile args (use -- to prevent clashes with other args)", nargs="*")
+    parser.add_argument("-u", "--usage", type=str,
+                        help="code that uses the file (placed in main)")
+    parser.add_argument("--prelude", type=str,
+                        help="code that precedes the file and the baseline (e.g. '#include <vector>')")
     parser.add_argument("-v", "--verbose", help="increase output verbosity",
                         action="store_true")
 
@@ -311,5 +859,6 @@ if __name__ == '__main__':
         else:
             args.compiler_typ = 'gcc'
     
-    json_result = run(args.file, args.include_dirs, args.dir, args.compiler, args.compiler_type, args.args, not args.verbose, args.verbose)
+    json_result = run(args.file, args.include_dirs, args.dir, args.compiler, args.compiler_type, args.args, not args.verbose, args.verbose,
+                      usage=args.usage, prelude=args.prelude)
     print(json_result)
\ No newline at end of file
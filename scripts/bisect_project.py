@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+
+import scripts.analyze_file
+import scripts.execute_jobs
+import scripts.fingerprints
+import scripts.generate_jobs
+
+
+def run(project, file, good, bad, dest_dir, *, compiler_name=None, variant=None, cpp=None,
+        metric="compile_time", threshold=0.05, min_abs=1, fetch_ttl=60, verbose=False):
+
+    def debug_print(s):
+        if verbose:
+            print(s)
+
+    cache_file = os.path.join(dest_dir, "job-cache.json")
+    job_cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, "r") as f:
+            job_cache = json.load(f)
+
+    cfg, cat, libpath = scripts.generate_jobs.find_project_config(project)
+    assert cfg["type"] in ["github", "gitlab"], "bisect requires a git project"
+    for dep_url in cfg.get("dependencies", {}):
+        assert cfg["dependencies"][dep_url]["version"] != "*", "bisect does not support '*' dependency versions"
+
+    # ===============================================
+    # select config
+
+    config = scripts.generate_jobs.find_config(compiler_name, variant, cpp, cfg.get("min-cpp", 11))
+    print("bisecting '{}' of {} with {} {} C++{}".format(file, project, config.compiler_name, config.variant, config.cpp))
+
+    # ===============================================
+    # get commit range
+
+    fetched_repos = set()
+    repo_dir = scripts.generate_jobs.get_repo_dir(cfg["url"], dest_dir, verbose)
+
+    def rev_parse(ref):
+        return scripts.generate_jobs.resolve_repo_ref(cfg["url"], ref, dest_dir, fetch_ttl=fetch_ttl,
+                                                      fetched_repos=fetched_repos, verbose=verbose)
+
+    good_sha = rev_parse(good)
+    bad_sha = rev_parse(bad)
+    commits = subprocess.check_output(["git", "rev-list", "--reverse", "--ancestry-path", good_sha + ".." + bad_sha],
+                                      cwd=repo_dir).decode("utf-8").split()
+    commits = [good_sha] + commits
+    assert commits[-1] == bad_sha, "bad ref must be a descendant of good ref"
+    print("{} commits in range {}..{}".format(len(commits) - 1, good, bad))
+
+    # ===============================================
+    # measure (via the shared job cache)
+
+    lib_tmp_dir = os.path.join(dest_dir, libpath)
+    extra_args = cfg.get("args", [])
+
+    def measure(sha):
+        version_dir = os.path.join(lib_tmp_dir, "versions", sha)
+        src_dir = os.path.join(version_dir, "src")
+        dep_dir = os.path.join(version_dir, "deps")
+        j = {
+            "version": sha,
+            "file": file,
+            "compiler": config.compiler,
+            "args": config.args + extra_args,
+            "include_dirs": [src_dir, dep_dir],
+        }
+        key = scripts.execute_jobs.make_cache_key(j)
+
+        res = job_cache.get(key)
+        if res is None or res.get("failed"):
+            if not os.path.exists(os.path.join(src_dir, file)):
+                scripts.generate_jobs.get_repo_files(cfg["url"], sha, cfg["working_dir"], src_dir, dest_dir,
+                                                     fetched_repos=fetched_repos, verbose=verbose)
+                for dep_url in cfg.get("dependencies", {}):
+                    dep_cfg = cfg["dependencies"][dep_url]
+                    scripts.generate_jobs.get_repo_files(dep_url, dep_cfg["version"], dep_cfg["dir"], dep_dir, dest_dir,
+                                                         fetched_repos=fetched_repos, verbose=verbose)
+
+        # known failures are only retried if the compiler or the files changed (as in execute_jobs)
+        if res is not None and res.get("failed") and res.get("fingerprint") != scripts.fingerprints.job_fingerprint(j):
+            res = None
+
+        if res is None:
+            try:
+                res = json.loads(scripts.analyze_file.run(file, j["include_dirs"], dest_dir, config.compiler,
+                                                          config.compiler_type, j["args"], not verbose, verbose))
+            except scripts.analyze_file.CompileError as e:
+                errors = [l for l in e.diagnostics.splitlines() if "error" in l]
+                res = {
+                    "failed": True,
+                    "error": errors[0] if errors else "(no diagnostics)",
+                    "command": " ".join(e.command),
+                    "diagnostics": e.diagnostics,
+                    "fingerprint": scripts.fingerprints.job_fingerprint(j),
+                }
+            job_cache[key] = res
+
+            if os.path.exists(cache_file):
+                shutil.copy(cache_file, cache_file + ".prev")
+            with open(cache_file, "w") as f:
+                json.dump(job_cache, f, indent=4)
+        else:
+            debug_print("  .. cached " + key)
+
+        if res.get("failed"):
+            debug_print("  .. failed: " + res["error"])
+            return None
+        value = res[metric] - res[metric + "_base"]
+        dev = 0
+        if metric + "_dev" in res and metric + "_base_dev" in res:
+            dev = res[metric + "_dev"] + res[metric + "_base_dev"]
+        return value, dev
+
+    def describe(sha):
+        return subprocess.check_output(["git", "log", "-1", "--format=%h %s", sha], cwd=repo_dir).decode("utf-8").strip()
+
+    def format_value(v):
+        if metric.endswith("_time"):
+            return "{:.1f} ms".format(1000 * v)
+        return "{} bytes".format(v)
+
+    # ===============================================
+    # bisect
+
+    values = {}
+
+    def check(idx):
+        # returns None for commits that fail to compile
+        sha = commits[idx]
+        if sha not in values:
+            values[sha] = measure(sha)
+        if values[sha] is None:
+            print("  {} failed to compile, skipped".format(describe(sha)))
+            return None
+        (v, dev) = values[sha]
+        print("  {} {} ({})".format(describe(sha), format_value(v), metric))
+        return v, dev
+
+    good_result = check(0)
+    if good_result is None:
+        print("{} fails to compile, cannot bisect".format(good))
+        return None
+    (good_value, good_dev) = good_result
+    # relative, but at least min_abs (in ms or bytes), as values close to the baseline can be ~0 or negative
+    floor = min_abs / 1000 if metric.endswith("_time") else min_abs
+    limit = good_value + max(threshold * abs(good_value), floor)
+
+    def is_bad(idx):
+        r = check(idx)
+        if r is None:
+            return None
+        (v, dev) = r
+        # must exceed the threshold by more than the measured dispersion
+        return v - dev > limit + good_dev
+
+    print("threshold: {}".format(format_value(limit)))
+
+    bad_result = is_bad(len(commits) - 1)
+    if bad_result is None:
+        print("{} fails to compile, cannot bisect".format(bad))
+        return None
+    if not bad_result:
+        print("{} does not exceed the threshold, nothing to bisect".format(bad))
+        return None
+
+    def probes(mid, lo, hi):
+        # mid and then its neighbours by distance (within lo..hi, exclusive)
+        for d in range(hi - lo):
+            for idx in [mid + d, mid - d] if d > 0 else [mid]:
+                if lo < idx < hi:
+                    yield idx
+
+    lo = 0
+    hi = len(commits) - 1
+    while hi - lo > 1:
+        # commits that fail to compile are skipped by probing a neighbouring one (as git bisect skip)
+        mid_bad = None
+        for mid in probes((lo + hi) // 2, lo, hi):
+            mid_bad = is_bad(mid)
+            if mid_bad is not None:
+                break
+        if mid_bad is None:
+            print("")
+            print("all commits between the last good and the first bad commit fail to compile, "
+                  "the first commit above threshold is one of:")
+            for idx in range(lo + 1, hi + 1):
+                print("  " + describe(commits[idx]))
+            return None
+        if mid_bad:
+            hi = mid
+        else:
+            lo = mid
+
+    print("")
+    print("first commit above threshold: {}".format(describe(commits[hi])))
+    print("  {} -> {}".format(format_value(values[commits[lo]][0]), format_value(values[commits[hi]][0])))
+    return commits[hi]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Find the commit that made a header slower (or bigger) via binary search")
+    parser.add_argument("project", metavar="P", help="project name (e.g. fmt)")
+    parser.add_argument("file", metavar="F", help="file in the project (e.g. fmt/format.h)")
+    parser.add_argument("good", metavar="GOOD", help="git ref without the regression")
+    parser.add_argument("bad", metavar="BAD", help="git ref with the regression")
+    parser.add_argument("-d", "--dir", required=True,
+                        help="directory to work in (the same as for generate_data.py)")
+    parser.add_argument("--compiler", help="compiler name of the config (e.g. 'GCC 9')")
+    parser.add_argument("--variant", help="variant of the config (e.g. Release)")
+    parser.add_argument("--cpp", type=int, help="C++ version of the config (e.g. 17)")
+    parser.add_argument("-m", "--metric", default="compile_time",
+                        choices=["compile_time", "preprocessing_time", "object_size"],
+                        help="metric to bisect (default: compile_time)")
+    parser.add_argument("-t", "--threshold", type=float, default=0.05,
+                        help="relative increase over GOOD that counts as regression (default: 0.05)")
+    parser.add_argument("--min-abs", type=float, default=1,
+                        help="minimal absolute increase in ms or bytes that counts as regression (default: 1)")
+    parser.add_argument("--fetch-ttl", type=float, default=60, metavar="MINUTES",
+                        help="only fetch the git repo if the last fetch is older than this (default: 60)")
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    run(args.project, args.file, args.good, args.bad, args.dir, compiler_name=args.compiler, variant=args.variant,
+        cpp=args.cpp, metric=args.metric, threshold=args.threshold, min_abs=args.min_abs, fetch_ttl=args.fetch_ttl,
+        verbose=args.verbose)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Portable cache bundles: cached results together with host and toolchain fingerprints (gzipped json),
+# so that results can be shared between machines with identical hardware and compilers
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+
+import scripts.execute_jobs
+import scripts.fingerprints
+
+
+def load_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, "r") as f:
+        return json.load(f)
+
+
+def export_bundle(cache_file, bundle_file, *, project=None):
+    job_cache = load_cache(cache_file)
+
+    results = {}
+    compilers = {}
+    skipped = 0
+    for (key, res) in job_cache.items():
+        # failures depend on the local setup, results without metadata cannot be attributed to a compiler
+        if res.get("failed") or "compiler" not in res:
+            skipped += 1
+            continue
+        if project is not None and res.get("project") != project:
+            continue
+        compiler = res["compiler"]
+        if compiler not in compilers:
+            if not os.path.exists(compiler):
+                skipped += 1
+                continue
+            compilers[compiler] = {
+                "fingerprint": scripts.fingerprints.toolchain_fingerprint(compiler),
+                "version": res.get("compiler_version"),
+            }
+        results[key] = res
+
+    bundle = {
+        "format": "compile-health-bundle",
+        "version": 1,
+        "host": scripts.fingerprints.host_info(),
+        "compilers": compilers,
+        "results": results,
+    }
+    with gzip.open(bundle_file, "wt", encoding="utf-8") as f:
+        json.dump(bundle, f)
+
+    print("exported {} results of {} compilers ({} skipped)".format(len(results), len(compilers), skipped))
+
+
+def import_bundle(cache_file, bundle_file, *, conflict="keep", any_host=False):
+    with gzip.open(bundle_file, "rt", encoding="utf-8") as f:
+        bundle = json.load(f)
+    assert bundle.get("format") == "compile-health-bundle" and bundle.get("version") == 1, "unknown bundle format"
+
+    host = scripts.fingerprints.host_info()
+    same_host = bundle["host"]["fingerprint"] == host["fingerprint"]
+    print("bundle from {} ({}, {} cores)".format(bundle["host"]["name"], bundle["host"]["cpu"], bundle["host"]["cpu_count"]))
+    if not same_host:
+        print("  .. different hardware than this host ({}, {} cores)".format(host["cpu"], host["cpu_count"]))
+        if not any_host:
+            print("nothing imported (use --any-host to import results of different hardware anyway)")
+            return
+
+    # only results of toolchains that are bit-identical to the local ones are imported
+    compilers = {}
+    for (compiler, c) in bundle["compilers"].items():
+        if not os.path.exists(compiler):
+            print("  .. skipping results of {} (not installed)".format(compiler))
+        elif scripts.fingerprints.toolchain_fingerprint(compiler) != c["fingerprint"]:
+            print("  .. skipping results of {} (different build: {})".format(compiler, c["version"]))
+        else:
+            compilers[compiler] = scripts.fingerprints.compiler_fingerprint(compiler)
+
+    job_cache = load_cache(cache_file)
+    counts = {"added": 0, "kept": 0, "replaced": 0, "merged": 0, "skipped": 0}
+    for (key, res) in bundle["results"].items():
+        if res["compiler"] not in compilers:
+            counts["skipped"] += 1
+            continue
+        res = dict(res)
+        res["compiler_fingerprint"] = compilers[res["compiler"]]
+        res["imported_from"] = bundle["host"]["name"]
+
+        local = job_cache.get(key)
+        if local is None or local.get("failed"):
+            job_cache[key] = res
+            counts["added"] += 1
+        elif conflict == "replace":
+            job_cache[key] = res
+            counts["replaced"] += 1
+        elif local.get("measured_at") is not None and local.get("measured_at") == res.get("measured_at"):
+            counts["kept"] += 1  # already imported (or exported from here)
+        elif conflict == "merge" and same_host:
+            # samples of identical hardware and toolchain are combined
+            local = dict(local)
+            local.setdefault("compiler_fingerprint", res["compiler_fingerprint"])
+            job_cache[key] = scripts.execute_jobs.merge_results(local, res)
+            counts["merged"] += 1
+        else:
+            counts["kept"] += 1
+
+    if os.path.exists(cache_file):
+        shutil.copy(cache_file, cache_file + ".prev")
+    with open(cache_file, "w") as f:
+        json.dump(job_cache, f, indent=4)
+
+    print("imported {added} new results ({replaced} replaced, {merged} merged, {kept} local results kept, "
+          "{skipped} skipped)".format(**counts))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Export or import cached results (e.g. to share them between benchmark machines)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="write cached results into a bundle")
+    export_parser.add_argument("cache", metavar="C", help="cache file (e.g. tmp/job-cache.json)")
+    export_parser.add_argument("bundle", metavar="B", help="bundle file (e.g. results.bundle.gz)")
+    export_parser.add_argument("-p", "--project", help="only export a specific project")
+
+    import_parser = subparsers.add_parser("import", help="merge the results of a bundle into the cache")
+    import_parser.add_argument("cache", metavar="C", help="cache file (e.g. tmp/job-cache.json)")
+    import_parser.add_argument("bundle", metavar="B", help="bundle file (e.g. results.bundle.gz)")
+    import_parser.add_argument("--conflict", choices=["keep", "replace", "merge"], default="keep",
+                               help="for results in both: keep the local one (default), replace it, "
+                                    "or merge the samples (same hardware only)")
+    import_parser.add_argument("--any-host", action="store_true",
+                               help="also import results that were measured on different hardware")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_bundle(args.cache, args.bundle, project=args.project)
+    else:
+        import_bundle(args.cache, args.bundle, conflict=args.conflict, any_host=args.any_host)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Calibration: a fixed reference suite is timed per compiler on each host,
+# so that timings of different machines can be normalized (see execute_jobs.build_result_data)
+
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import scripts.fingerprints
+import scripts.generate_jobs
+
+# changing the suite invalidates all calibrations
+suite_version = 1
+
+suite_headers = ["vector", "string", "map", "algorithm", "functional"]
+
+
+def synthetic_workload(count=300):
+    # many distinct class template instantiations and constexpr recursion
+    lines = [
+        "template <int N> struct fib { static constexpr long value = fib<N - 1>::value + fib<N - 2>::value; };",
+        "template <> struct fib<0> { static constexpr long value = 0; };",
+        "template <> struct fib<1> { static constexpr long value = 1; };",
+    ]
+    for i in range(count):
+        lines.append("template <class T> struct w{0} {{ T value; T get() const {{ return value + T({0}); }} }};".format(i))
+        lines.append("long f{0}() {{ return w{0}<long>{{{0}}}.get() + fib<{1}>::value; }}".format(i, 20 + i % 40))
+    return "\n".join(lines) + "\n"
+
+
+def measure(sargs, samples=7):
+    ts = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        subprocess.check_call(sargs, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ts.append(time.perf_counter() - t0)
+    return min(ts)
+
+
+def calibrate_compiler(config, dest_dir):
+    # returns the timings of the suite (in seconds) and their sum as score
+    assert config.compiler_type == 'gcc', "calibration is only supported for gcc-style compilers"
+    sources = {}
+    for h in suite_headers:
+        sources["<" + h + ">"] = "#include <" + h + ">\nint main() { return 0; }\n"
+    sources["templates"] = synthetic_workload()
+
+    timings = {}
+    for (name, code) in sources.items():
+        src = os.path.join(dest_dir, "calibration.cc")
+        with open(src, "w") as f:
+            f.write(code)
+        timings[name] = measure([config.compiler] + config.args + ["-c", src, "-o", os.path.join(dest_dir, "calibration.o")])
+
+    version = subprocess.check_output([config.compiler, "--version"]).decode("utf-8").splitlines()[0]
+    return {
+        "score": sum(timings.values()),
+        "timings": timings,
+        "compiler_version": version,
+        "args": config.args,
+        "measured_at": time.time(),
+    }
+
+
+def load_calibration(calibration_file):
+    if not os.path.exists(calibration_file):
+        return {"version": suite_version, "hosts": {}}
+    with open(calibration_file, "r") as f:
+        calibration = json.load(f)
+    if calibration.get("version") != suite_version:
+        print("ignoring calibration of an older reference suite in " + calibration_file)
+        return {"version": suite_version, "hosts": {}}
+    return calibration
+
+
+def host_scores(calibration_file, host=None):
+    # returns {compiler: score} of a host (by name, this host by default)
+    calibration = load_calibration(calibration_file)
+    fingerprint = scripts.fingerprints.host_info()["fingerprint"]
+    for entry in calibration["hosts"].values():
+        if entry["host"]["name"] == host or (host is None and entry["host"]["fingerprint"] == fingerprint):
+            return {c: e["score"] for (c, e) in entry["compilers"].items()}
+    return {}
+
+
+def run(calibration_file, dest_dir, *, compiler_name=None):
+    host = scripts.fingerprints.host_info()
+    calibration = load_calibration(calibration_file)
+    entry = calibration["hosts"].setdefault(host["fingerprint"], {"host": host, "compilers": {}})
+    entry["host"] = host
+
+    # the first (debug) config of each compiler
+    configs = {}
+    for c in scripts.generate_jobs.generate_configs():
+        if compiler_name is not None and c.compiler_name != compiler_name:
+            continue
+        if c.compiler not in configs and c.compiler_type == 'gcc':
+            configs[c.compiler] = c
+
+    print("calibrating {} compilers on {} ({}, {} cores)".format(len(configs), host["name"], host["cpu"], host["cpu_count"]))
+    for (compiler, config) in configs.items():
+        result = calibrate_compiler(config, dest_dir)
+        entry["compilers"][compiler] = result
+        print("  {}: {:.1f} ms".format(config.compiler_name, 1000 * result["score"]))
+
+    with open(calibration_file, "w") as f:
+        json.dump(calibration, f, indent=4)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time a fixed reference suite per compiler to normalize timings between machines")
+    parser.add_argument("calibration", metavar="C", help="calibration file (e.g. tmp/calibration.json)")
+    parser.add_argument("-d", "--dir", required=True,
+                        help="temporary directory to use (e.g. /tmp)")
+    parser.add_argument("--compiler", help="only calibrate this compiler (e.g. 'GCC 9')")
+
+    args = parser.parse_args()
+
+    run(args.calibration, args.dir, compiler_name=args.compiler)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import math
+
+import scripts.execute_jobs
+
+default_metrics = [
+    "compile_time",
+    "preprocessing_time",
+    "line_count",
+    "object_size",
+]
+
+
+def load_rows(data_file, version, metrics, compiler):
+    # with a compiler (name), only its results are loaded and matched without the compiler
+    with open(data_file, "r") as f:
+        data = json.load(f)
+
+    columns = data.get("columns", ["variant"] + scripts.execute_jobs.result_columns)
+    col_idx = {c: i for i, c in enumerate(columns)}
+    optional = scripts.execute_jobs.optional_result_columns
+    for m in metrics:
+        assert m in col_idx or m in optional, "unknown metric " + m
+
+    def value(r, extra, c):
+        # positional column or (for optional columns) from the trailing dict
+        return r[col_idx[c]] if c in col_idx else extra.get(c)
+
+    # metrics with a baseline are compared as cost over the baseline
+    net_metrics = []
+    for m in metrics:
+        has_base = m + "_base" in col_idx or m + "_base" in optional
+        net_metrics.append((m, m + "_base" if has_base else None))
+
+    variant_keys = []
+    for v in data["variants"]:
+        if compiler is None:
+            variant_keys.append((v["compiler_name"], v["name"], v["cpp"]))
+        elif v["compiler_name"] == compiler:
+            variant_keys.append((v["name"], v["cpp"]))
+        else:
+            variant_keys.append(None)
+    assert any(k is not None for k in variant_keys), "no results of {} in {}".format(compiler, data_file)
+
+    rows = {}
+    row_versions = {}
+    for p in data["projects"]:
+        if version is not None and p["version"] != version:
+            continue
+        for f in p["files"]:
+            for r in f["results"]:
+                if variant_keys[r[0]] is None:
+                    continue
+                key = (p["name"], f["name"], variant_keys[r[0]])
+                if key in rows:
+                    assert row_versions[key] == p["version"], \
+                        "multiple versions of {} in {}, use --versions to select one".format(p["name"], data_file)
+                    assert False, "multiple results for '{}' of {} ({}) in {}".format(
+                        f["name"], p["name"], " ".join(str(k) for k in key[2]), data_file)
+                row_versions[key] = p["version"]
+                extra = r[-1] if isinstance(r[-1], dict) else {}
+                values = {}
+                for (m, b) in net_metrics:
+                    val = value(r, extra, m)
+                    if val is None or (b is not None and value(r, extra, b) is None):
+                        continue  # optional metric not recorded for this result
+                    dev = extra.get(m + "_dev")
+                    if b is not None:
+                        val -= value(r, extra, b)
+                        bdev = extra.get(m + "_base_dev")
+                        if dev is not None and bdev is not None:
+                            dev = math.sqrt(dev * dev + bdev * bdev)
+                        else:
+                            dev = None
+                    values[m] = (val, dev)
+                rows[key] = values
+
+    return rows
+
+
+def run(old_file, new_file, dest_file, *, old_version=None, new_version=None, metrics=default_metrics,
+        threshold=0.02, min_abs=1, sigma=3, compilers=None, top=50):
+
+    old_compiler, new_compiler = compilers if compilers else (None, None)
+    old_rows = load_rows(old_file, old_version, metrics, old_compiler)
+    new_rows = load_rows(new_file, new_version, metrics, new_compiler)
+
+    regressions = []
+    improvements = []
+    matched = 0
+    for key, old_values in old_rows.items():
+        new_values = new_rows.get(key)
+        if new_values is None:
+            continue
+        matched += 1
+        for m in metrics:
+            if m not in old_values or m not in new_values:
+                continue
+            (old_val, old_dev) = old_values[m]
+            (new_val, new_dev) = new_values[m]
+            delta = new_val - old_val
+
+            # noise threshold: relative, absolute, and dispersion-based (if recorded)
+            noise = max(min_abs, threshold * abs(old_val))
+            if old_dev is not None and new_dev is not None:
+                noise = max(noise, sigma * math.sqrt(old_dev * old_dev + new_dev * new_dev))
+            if delta == 0 or abs(delta) < noise:
+                continue
+
+            rel = delta / abs(old_val) if old_val != 0 else math.copysign(math.inf, delta)
+            entry = {
+                "project": key[0],
+                "file": key[1],
+                "variant": " ".join(str(k) for k in key[2]),
+                "metric": m,
+                "old": old_val,
+                "new": new_val,
+                "delta": delta,
+                "relative": rel,
+                "noise": noise,
+            }
+            if delta > 0:
+                regressions.append(entry)
+            else:
+                improvements.append(entry)
+
+    regressions.sort(key=lambda e: (-e["relative"], -e["delta"]))
+    improvements.sort(key=lambda e: (e["relative"], e["delta"]))
+
+    def describe(data_file, version, compiler):
+        return data_file + ("@" + version if version else "") + (" ({})".format(compiler) if compiler else "")
+
+    report = {
+        "old": describe(old_file, old_version, old_compiler),
+        "new": describe(new_file, new_version, new_compiler),
+        "matched": matched,
+        "only_old": len(old_rows) - matched,
+        "only_new": len(new_rows) - matched,
+        "regressions": regressions,
+        "improvements": improvements,
+    }
+
+    # ===============================================
+    # text report
+
+    def print_entries(entries):
+        shown = entries if not top else entries[0:top]
+        for e in shown:
+            rel = "{:+.1f}%".format(100 * e["relative"]) if math.isfinite(e["relative"]) else "from 0"
+            print("  {:>8} {:>10} -> {:<10} {:<18} {} '{}' ({})".format(
+                rel, e["old"], e["new"], e["metric"], e["project"], e["file"], e["variant"]))
+        if len(shown) < len(entries):
+            print("  ... and {} more".format(len(entries) - len(shown)))
+
+    print("comparing {} to {}".format(report["old"], report["new"]))
+    print("matched {} results ({} only in old, {} only in new)".format(
+        matched, report["only_old"], report["only_new"]))
+    print("(times in ms and sizes in bytes, both relative to the baseline where available)")
+    print("")
+    print("{} regressions:".format(len(regressions)))
+    print_entries(regressions)
+    print("")
+    print("{} improvements:".format(len(improvements)))
+    print_entries(improvements)
+
+    if dest_file:
+        with open(dest_file, "w") as f:
+            # inf is not valid json
+            for e in regressions + improvements:
+                if not math.isfinite(e["relative"]):
+                    e["relative"] = None
+            json.dump(report, f, indent=4)
+
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare two C++ compile-health result files")
+    parser.add_argument("old", metavar="OLD", help="old result file (e.g. compile-health-data.json)")
+    parser.add_argument("new", metavar="NEW", nargs="?",
+                        help="new result file (defaults to OLD, e.g. for comparing two versions)")
+    parser.add_argument("--versions", nargs=2, metavar=("OLD_VERSION", "NEW_VERSION"),
+                        help="only compare these project versions (e.g. --versions 6.0.0 6.1.0)")
+    parser.add_argument("-m", "--metrics", nargs="+", default=default_metrics,
+                        help="metrics to compare (default: {})".format(" ".join(default_metrics)))
+    parser.add_argument("-t", "--threshold", type=float, default=0.02,
+                        help="minimal relative change to report (default: 0.02)")
+    parser.add_argument("--min-abs", type=float, default=1,
+                        help="minimal absolute change to report (default: 1)")
+    parser.add_argument("--sigma", type=float, default=3,
+                        help="minimal change in multiples of the recorded dispersion (default: 3)")
+    parser.add_argument("--compilers", nargs=2, metavar=("OLD_COMPILER", "NEW_COMPILER"),
+                        help="compare the results of these compilers (e.g. --compilers 'GCC 8' 'GCC 9')")
+    parser.add_argument("--top", type=int, default=50,
+                        help="number of regressions and improvements to print (0 for all)")
+    parser.add_argument("-o", "--json", help="write full report to this json file")
+
+    args = parser.parse_args()
+
+    new_file = args.new if args.new else args.old
+    assert args.new or args.versions or args.compilers, "comparing a file to itself requires --versions or --compilers"
+    old_version, new_version = args.versions if args.versions else (None, None)
+
+    run(args.old, new_file, args.json, old_version=old_version, new_version=new_version, metrics=args.metrics,
+        threshold=args.threshold, min_abs=args.min_abs, sigma=args.sigma, compilers=args.compilers,
+        top=args.top)
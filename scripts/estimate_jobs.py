@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Fast estimation: only a stratified subset of configs is measured per header,
+# the remaining configs are extrapolated via config-to-config ratios learned from measured results.
+
+# job fields that identify a measurement (also stored in the job cache for learning)
+metadata_keys = ["project", "version", "file", "compiler", "variant", "cpp"]
+
+
+def header_id(j):
+    # rows with usage snippets (or another prelude) are separate "headers"
+    return (j["project"], j["version"], j["file"], j.get("usage"), j.get("prelude"))
+
+
+def config_id(j):
+    return (j["compiler"], j["variant"], j["cpp"])
+
+
+def baseline_id(j):
+    # baselines only depend on the full args and the prelude (observations without args are not used)
+    if "args" not in j:
+        return None
+    return (config_id(j), tuple(j["args"]), j.get("prelude"))
+
+
+def strata(j):
+    return set([("compiler", j["compiler"]), ("cpp", j["cpp"]), ("variant", j["variant"])])
+
+
+def select_samples(to_execute, measured):
+    # per header, greedily picks jobs until every compiler, standard, and variant
+    # is covered by at least one measured or sampled job
+    covered = {}
+    for j in measured:
+        covered.setdefault(header_id(j), set()).update(strata(j))
+
+    groups = {}
+    for j in to_execute:
+        groups.setdefault(header_id(j), []).append(j)
+
+    samples = []
+    rest = []
+    for (h, jobs) in groups.items():
+        needed = set()
+        for j in jobs:
+            needed |= strata(j)
+        needed -= covered.get(h, set())
+
+        remaining = list(jobs)
+        while needed:
+            best = max(remaining, key=lambda j: len(strata(j) & needed))
+            samples.append(best)
+            remaining.remove(best)
+            needed -= strata(best)
+        rest += remaining
+
+    return samples, rest
+
+
+def estimate_results(targets, observations, metrics):
+    # returns (job, estimated result) for all targets that can be extrapolated
+    by_header = {}
+    by_config = {}
+    by_baseline = {}
+    for o in observations:
+        if o.get("estimated") or any(k not in o for k in metadata_keys):
+            continue
+        by_header.setdefault(header_id(o), {})[config_id(o)] = o
+        by_config[config_id(o)] = o
+        if baseline_id(o) is not None:
+            by_baseline[baseline_id(o)] = o
+
+    model_cache = {}
+
+    def model(project, cs, ct, m):
+        # median ratio of metric m between two configs (over all headers of a project or of all projects)
+        # metrics that are zero for cs (e.g. bss_size) fall back to the median difference
+        key = (project, cs, ct, m)
+        if key not in model_cache:
+            rs = []
+            ds = []
+            for (h, cfgs) in by_header.items():
+                if project is not None and h[0] != project:
+                    continue
+                if cs in cfgs and ct in cfgs:
+                    if cfgs[cs][m] > 0:
+                        rs.append(cfgs[ct][m] / cfgs[cs][m])
+                    ds.append(cfgs[ct][m] - cfgs[cs][m])
+            rs.sort()
+            ds.sort()
+            model_cache[key] = (rs[len(rs) // 2] if rs else None, ds[len(ds) // 2] if ds else None)
+        return model_cache[key]
+
+    def predict(project, cs, ct, m, value):
+        (r, d) = model(project, cs, ct, m)
+        if r is not None and value > 0:
+            return value * r
+        if d is not None:
+            return value + d
+        return None
+
+    estimated = []
+    for t in targets:
+        samples = by_header.get(header_id(t), {})
+        ct = config_id(t)
+        bt = baseline_id(t)
+        if not samples:
+            continue
+
+        est = {}
+        for m in metrics:
+            # baselines do not depend on the header
+            if m.endswith("_base") and bt in by_baseline:
+                est[m] = by_baseline[bt][m]
+                continue
+
+            preds = []
+            for (cs, o) in samples.items():
+                p = predict(t["project"], cs, ct, m, o[m])
+                if p is None:
+                    p = predict(None, cs, ct, m, o[m])
+                if p is not None:
+                    preds.append(p)
+            if not preds:
+                est = None
+                break
+            preds.sort()
+            est[m] = preds[len(preds) // 2]
+            if isinstance(next(iter(samples.values()))[m], int):
+                est[m] = int(round(est[m]))
+
+        if est is None:
+            continue
+
+        same_compiler = [o for (c, o) in by_config.items() if c[0] == t["compiler"]]
+        est["compiler_version"] = same_compiler[0]["compiler_version"] if same_compiler else "unknown"
+        est["estimated"] = True
+        estimated.append((t, est))
+
+    return estimated
@@ -4,133 +4,414 @@ import shutil
 import gzip
 import os
 import argparse
+import hashlib
 import platform
 import json
+import time
 
 import scripts.analyze_file
-
-def run(jobs_file, dest_file, dest_dir, cache_file, verbose):
+import scripts.calibrate
+import scripts.estimate_jobs
+import scripts.fingerprints
+import scripts.history_db
+
+
+def preprocessor_args(compiler_type, args):
+    # returns the args that can influence the preprocessed output
+    # (debug info and warnings do not, optimization levels only via predefined macros)
+    # (level 3 debug info such as -g3 or -ggdb3 implies -dD and keeps the macros in the output)
+    pargs = []
+    opt_level = None
+    for a in args:
+        if compiler_type == 'msvc':
+            if a in ['/Zi', '/Z7', '/GS', '/GS-'] or a.startswith('/Ob'):
+                continue
+            if a.startswith('/O'):
+                # clang-cl defines __OPTIMIZE__ for all but /Od
+                opt_level = '/Od' if a == '/Od' else '/O'
+                continue
+        elif compiler_type == 'gcc':
+            if a in ['-g', '-g0', '-g1', '-g2']:
+                continue
+            if a.startswith('-W') and not a.startswith('-Wp,'):
+                continue
+            if a.startswith('-O'):
+                # only __OPTIMIZE__, __OPTIMIZE_SIZE__, and __FAST_MATH__ depend on the level
+                if a in ['-O0']:
+                    opt_level = '-O0'
+                elif a in ['-Os', '-Oz']:
+                    opt_level = '-Os'
+                elif a in ['-Ofast']:
+                    opt_level = '-Ofast'
+                else:
+                    opt_level = '-O'
+                continue
+        pargs.append(a)
+    if opt_level is not None:
+        pargs.append(opt_level)
+    return pargs
+
+
+# positional columns of each result row (after the variant index)
+# timings are stored in milliseconds
+result_columns = [
+    "compile_time",
+    "compile_time_base",
+    "preprocessing_time",
+    "preprocessing_time_base",
+    "line_count",
+    "line_count_raw",
+    "object_size",
+    "object_size_base",
+    "text_size",
+    "data_size",
+    "bss_size",
+    "string_size",
+    "code_symbol_size",
+    "data_symbol_size",
+    "weak_symbol_size",
+    "symbol_name_size",
+    "string_count",
+    "undefined_symbol_count",
+    "code_symbol_count",
+    "data_symbol_count",
+    "weak_symbol_count",
+]
+
+# columns that are not available for all results
+# (appended to a row as a trailing dict if present)
+optional_result_columns = [
+    "compile_time_dev",
+    "compile_time_base_dev",
+    "preprocessing_time_dev",
+    "preprocessing_time_base_dev",
+    "estimated",
+    "link_time",
+    "link_time_base",
+    "link_time_dev",
+    "link_time_base_dev",
+    "binary_size",
+    "binary_size_base",
+    "link_eliminated_symbol_count",
+    "link_eliminated_symbol_size",
+    "compile_time_cold",
+    "compile_time_cold_dev",
+    "bytes_read_cold",
+    "include_closure_size",
+    "compile_instructions",
+    "compile_instructions_base",
+    "compile_cycles",
+    "compile_cycles_base",
+    "compile_page_faults",
+    "compile_page_faults_base",
+    "concurrency_scaling",
+    "frontend_time",
+    "frontend_time_base",
+    "frontend_time_dev",
+    "frontend_time_base_dev",
+    "assembler_time",
+    "assembler_time_base",
+    "assembler_time_dev",
+    "assembler_time_base_dev",
+    "driver_overhead",
+    "driver_overhead_base",
+    "driver_overhead_noisy",
+    "driver_overhead_base_noisy",
+    "token_count",
+    "identifier_count",
+    "declaration_count",
+    "template_count",
+    "longest_line",
+    "longest_line_tokens",
+]
+
+time_columns = set([
+    "compile_time",
+    "compile_time_base",
+    "preprocessing_time",
+    "preprocessing_time_base",
+    "compile_time_dev",
+    "compile_time_base_dev",
+    "preprocessing_time_dev",
+    "preprocessing_time_base_dev",
+    "link_time",
+    "link_time_base",
+    "link_time_dev",
+    "link_time_base_dev",
+    "compile_time_cold",
+    "compile_time_cold_dev",
+    "frontend_time",
+    "frontend_time_base",
+    "frontend_time_dev",
+    "frontend_time_base_dev",
+    "assembler_time",
+    "assembler_time_base",
+    "assembler_time_dev",
+    "assembler_time_base_dev",
+    "driver_overhead",
+    "driver_overhead_base",
+])
+
+
+def read_jobs(jobs_file):
+    # yields one (denormalized) dict per job
+    # accepts the normalized line-based format of generate_jobs.write_jobs and the old plain json list
+    with open(jobs_file, "r") as f:
+        header = f.readline()
+        if header.lstrip().startswith("["):
+            f.seek(0)
+            for j in json.load(f):
+                yield j
+            return
+
+        header = json.loads(header)
+        assert header.get("format") == "compile-health-jobs" and header.get("version") == 2, "unknown jobs file format"
+
+        tables = {"config": [], "project": [], "file": []}
+        for l in f:
+            e = json.loads(l)
+            if e[0] == "job":
+                c = tables["config"][e[1]]
+                p = tables["project"][e[2]]
+                fe = tables["file"][e[3]]
+                j = {}
+                j.update(p)
+                j.update(fe)
+                j.update(c)
+                del j["extra_args"]
+                j["args"] = c["args"] + fe["extra_args"]
+                yield j
+            else:
+                assert e[1] == len(tables[e[0]]), "malformed jobs file"
+                tables[e[0]].append(e[2])
+
+
+def make_cache_key(j):
+    id = []
+    if j["version"] != "":
+        id.append(j["version"])
+    id.append(j["file"])
+    id.append(j["compiler"])
+    id += j["args"]
+    if j.get("usage"):
+        id.append("usage=" + hashlib.sha1(j["usage"].encode("utf-8")).hexdigest())
+    if j.get("prelude"):
+        id.append("prelude=" + hashlib.sha1(j["prelude"].encode("utf-8")).hexdigest())
+    if j.get("commit"):
+        id.append("commit=" + j["commit"])
+    for (_, sha) in sorted(j.get("dependency_commits", {}).items()):
+        id.append("dep=" + sha)
+    return ":".join(id)
+
+
+def merge_results(old, new):
+    # samples of a refinement are combined with the previous ones (if measured with the same compiler)
+    if old.get("compiler_fingerprint") != new.get("compiler_fingerprint"):
+        return new
+    merged = dict(old)
+    merged.update(new)
+    for k in new:
+        if k.endswith("_samples") and k in old:
+            name = k[:-len("_samples")]
+            merged[k] = sorted(old[k] + new[k])
+            merged[name], merged[name + "_dev"] = scripts.analyze_file.timing_stats(merged[k])
+    return merged
+
+
+def refinement_priority(res, compiler_fingerprint):
+    # lower is more valuable: noisy results or results with few samples first,
+    # then results of a different compiler build, then the oldest ones
+    noise = 0
+    for k in ["compile_time", "compile_time_base", "preprocessing_time", "preprocessing_time_base"]:
+        if k + "_dev" not in res or len(res.get(k + "_samples", [])) < 5:
+            noise = max(noise, 1)
+        elif res[k] > 0:
+            noise = max(noise, res[k + "_dev"] / res[k])
+    if noise > 0.02:
+        return (0, -noise)
+    return (1, res.get("compiler_fingerprint") == compiler_fingerprint, res.get("measured_at", 0))
+
+
+def build_result_data(results, *, reference=None):
+    # with reference scores ({compiler: calibration score} of a host), timings of all hosts are
+    # normalized to the reference host and results without calibration are omitted
+    proj_list = []
+    variant_to_idx = {}
+    variants = []
+    cresult = {
+        "projects": proj_list,
+        "variants": variants,
+        "columns": ["variant"] + result_columns,
+    }
+    if reference is not None:
+        cresult["normalized"] = True
+    curr_proj = {"name": None, "version": None}
+    curr_files = None
+    curr_file = {"name": None}
+    curr_results = None
+    for j in results:
+        scale = 1
+        if reference is not None:
+            if "calibration" not in j or j["compiler"] not in reference:
+                continue
+            scale = reference[j["compiler"]] / j["calibration"]
+
+        varid = j["compiler"] + " " + j["argstr"]
+        if varid not in variant_to_idx:
+            variant_to_idx[varid] = len(variants)
+            variants.append({
+                "name": j["variant"],
+                "compiler_name": j["compiler_name"],
+                "compiler_path": j["compiler"],
+                "compiler_version": j["compiler_version"],
+                "cpp": j["cpp"],
+                "args": j["argstr"],
+            })
+
+        if curr_proj["name"] != j["project"] or curr_proj["version"] != j["version"]:
+            curr_files = []
+            curr_file = {"name": None}
+            curr_proj = {
+                "name": j["project"],
+                "version": j["version"],
+                "url": j["project_url"],
+                "category": j["category"],
+                "files": curr_files,
+            }
+            if j.get("prelude"):
+                curr_proj["prelude"] = j["prelude"]
+            proj_list.append(curr_proj)
+
+        if curr_file["name"] != j["name"]:
+            curr_results = []
+            curr_file = {
+                "name": j["name"],
+                "url": j["url"],
+                "results": curr_results
+            }
+            if j.get("usage_name"):
+                curr_file["usage"] = j["usage_name"]
+            if j.get("commit"):
+                curr_file["commit"] = j["commit"]
+            curr_files.append(curr_file)
+
+        row = [variant_to_idx[varid]]
+        for c in result_columns:
+            row.append(int(1000 * scale * j[c]) if c in time_columns else j[c])
+        extra = {}
+        for c in optional_result_columns:
+            if c in j:
+                extra[c] = round(1000 * scale * j[c], 3) if c in time_columns else j[c]
+        if "concurrency_scaling" in extra:
+            extra["concurrency_scaling"] = [{
+                "jobs": sc["jobs"],
+                "makespan": round(1000 * sc["makespan"], 3),
+                "latency": round(1000 * sc["latency"], 3),
+                "throughput": round(sc["throughput"], 3),
+                "efficiency": round(sc["efficiency"], 3),
+            } for sc in extra["concurrency_scaling"]]
+        if extra:
+            row.append(extra)
+        curr_results.append(row)
+
+    # TODO: proper gzipped result
+    # with gzip.GzipFile(dest_file + ".gz", "w") as f:
+    #     f.write(json.dumps(results).encode("utf-8"))
+
+    return cresult
+
+
+def run(jobs_file, dest_file, dest_dir, cache_file, verbose, *, retry_failed=False, history_file=None, estimate=False,
+        link_objects=0, linker=None, cold=False, counters=False, concurrency=0, bypass_driver=False, budget=None,
+        normalize=None):
     
     job_cache = {}
 
-
-    def build_result_data(results):
-        proj_list = []
-        variant_to_idx = {}
-        variants = []
-        cresult = {
-            "projects": proj_list,
-            "variants": variants
-        }
-        curr_proj = {"name": None, "version": None}
-        curr_files = None
-        curr_file = {"name": None}
-        curr_results = None
-        for j in results:
-            varid = j["compiler"] + " " + j["argstr"]
-            if varid not in variant_to_idx:
-                variant_to_idx[varid] = len(variants)
-                variants.append({
-                    "name": j["variant"],
-                    "compiler_name": j["compiler_name"],
-                    "compiler_path": j["compiler"],
-                    "compiler_version": j["compiler_version"],
-                    "cpp": j["cpp"],
-                    "args": j["argstr"],
-                })
-
-            if curr_proj["name"] != j["project"] or curr_proj["version"] != j["version"]:
-                curr_files = []
-                curr_file = {"name": None}
-                curr_proj = {
-                    "name": j["project"],
-                    "version": j["version"],
-                    "url": j["project_url"],
-                    "category": j["category"],
-                    "files": curr_files,
-                }
-                proj_list.append(curr_proj)
-
-            if curr_file["name"] != j["name"]:
-                curr_results = []
-                curr_file = {
-                    "name": j["name"],
-                    "url": j["url"],
-                    "results": curr_results
-                }
-                curr_files.append(curr_file)
-
-            curr_results.append([
-                variant_to_idx[varid],
-                int(1000 * j["compile_time"]),
-                int(1000 * j["compile_time_base"]),
-                int(1000 * j["preprocessing_time"]),
-                int(1000 * j["preprocessing_time_base"]),
-                j["line_count"],
-                j["line_count_raw"],
-                j["object_size"],
-                j["object_size_base"],
-                j["text_size"],
-                j["data_size"],
-                j["bss_size"],
-                j["string_size"],
-                j["code_symbol_size"],
-                j["data_symbol_size"],
-                j["weak_symbol_size"],
-                j["symbol_name_size"],
-                j["string_count"],
-                j["undefined_symbol_count"],
-                j["code_symbol_count"],
-                j["data_symbol_count"],
-                j["weak_symbol_count"],
-            ])
-
-        # TODO: proper gzipped result
-        # with gzip.GzipFile(dest_file + ".gz", "w") as f:
-        #     f.write(json.dumps(results).encode("utf-8"))
-
-        return cresult
+    history = None
+    if history_file is not None:
+        history = scripts.history_db.open_db(history_file)
 
 
     # ===============================================
     # read jobs and cache
 
 
-    with open(jobs_file, "r") as f:
-        jobs = json.load(f)
     if os.path.exists(cache_file):
         with open(cache_file, "r") as f:
             job_cache = json.load(f)
 
-    print("executing {} jobs".format(len(jobs)))
     print("found {} cached jobs in total".format(len(job_cache)))
 
+    # include dirs are only hashed once per run
+    scripts.fingerprints.directory_fingerprints.clear()
+
+    # results are tagged with the host and its calibration score (see scripts.calibrate)
+    calibration_file = os.path.join(dest_dir, "calibration.json")
+    host_fingerprint = scripts.fingerprints.host_info()["fingerprint"]
+    calibration = scripts.calibrate.host_scores(calibration_file)
+    reference = None
+    if normalize is not None:
+        reference = scripts.calibrate.host_scores(calibration_file, normalize or None)
+        assert reference, "no calibration for the reference host (run scripts.calibrate first)"
+
     found_cached = 0
 
     idx = 0
 
     results = []
     to_execute = []
-
-    for j in jobs:
-        id = []
-        if j["version"] != "":
-            id.append(j["version"])
-        id.append(j["file"])
-        id.append(j["compiler"])
-        id += j["args"]
-        id = ":".join(id)
+    known_failures = []
+
+    def link_usage(j):
+        # usage snippets are also placed in the link TUs
+        return j.get("link_usage", j.get("usage"))
+
+    def link_config(j):
+        if link_objects <= 0:
+            return None
+        return {"objects": link_objects, "linker": linker, "usage": link_usage(j)}
+
+    def has_requested_stages(j, res):
+        if link_config(j) not in [None, res.get("link_config")]:
+            return False
+        if cold and "compile_time_cold" not in res:
+            return False
+        if counters and "compile_page_faults" not in res:
+            return False
+        if bypass_driver and "driver_overhead" not in res:
+            return False
+        if concurrency > 0 and [sc["jobs"] for sc in res.get("concurrency_scaling", [])] != \
+                scripts.analyze_file.concurrency_levels(concurrency):
+            return False
+        return True
+
+    for j in read_jobs(jobs_file):
+        id = make_cache_key(j)
         j["id"] = idx
         j["cache-key"] = id
         j["argstr"] = " ".join(j["args"])
 
         res = {}
 
-        if id in job_cache:
+        if id in job_cache and job_cache[id].get("failed"):
+            # failures are only retried if requested or if any input changed
+            res = job_cache[id]
+            if retry_failed or res["fingerprint"] != scripts.fingerprints.job_fingerprint(j):
+                to_execute.append(j)
+            else:
+                j["error"] = res["error"]
+                known_failures.append(j)
+        elif id in job_cache and not has_requested_stages(j, job_cache[id]):
+            # cached without a requested optional stage
+            to_execute.append(j)
+        elif id in job_cache:
             res = job_cache[id]
             found_cached += 1
             for k in res:
                 j[k] = res[k]
+            if "calibration" not in j and j.get("host_fingerprint", host_fingerprint) == host_fingerprint \
+                    and j["compiler"] in calibration:
+                j["calibration"] = calibration[j["compiler"]]
             results.append(j)
         else:
             to_execute.append(j)
@@ -139,37 +420,183 @@ def run(jobs_file, dest_file, dest_dir, cache_file, verbose):
 
     # write before
     with open(dest_file, "w") as f:
-        json.dump(build_result_data(results), f)
+        json.dump(build_result_data(results, reference=reference), f)
 
+    print("executing {} jobs".format(idx))
     print("was able to reuse {} results from cache".format(found_cached))
+    print("skipping {} known failures (use --retry-failed to retry them)".format(len(known_failures)))
     print("has to execute {} more jobs".format(len(to_execute)))
 
+    to_estimate = []
+    if estimate:
+        to_execute, to_estimate = scripts.estimate_jobs.select_samples(to_execute, results)
+        print("estimate mode: only measuring {} jobs, estimating {} jobs".format(len(to_execute), len(to_estimate)))
+
+    # with a time budget (in minutes), missing jobs are executed first and the remaining time
+    # is used to refine cached results (ordered by refinement_priority)
+    refining = set()
+    if budget is not None:
+        refinements = sorted(results, key=lambda j: refinement_priority(
+            job_cache[j["cache-key"]], scripts.fingerprints.compiler_fingerprint(j["compiler"])))
+        refining = set(j["id"] for j in refinements)
+        to_execute += refinements
+        print("budget mode: {} minutes for {} missing jobs and refining up to {} cached results".format(
+            budget, len(to_execute) - len(refinements), len(refinements)))
+    start_time = time.time()
+    job_durations = []
+
+    def write_cache():
+        if os.path.exists(cache_file):
+            shutil.copy(cache_file, cache_file + ".prev")
+        with open(cache_file, "w") as f:
+            json.dump(job_cache, f, indent=4)
+
+    def first_error_line(diagnostics):
+        lines = diagnostics.splitlines()
+        for l in lines:
+            if "error" in l:
+                return l
+        return lines[0] if lines else "(no diagnostics)"
+
+    # preprocessing is only measured once per preprocessor-equivalent group
+    def preprocessing_key(j):
+        key = [j["version"], j.get("commit", ""), j["file"], j.get("usage", ""), j.get("prelude", ""), j["compiler"]]
+        key += j["include_dirs"]
+        key += preprocessor_args(j["compiler_type"], j["args"])
+        return "\n".join(key)
+
+    preprocessing_results = {}
+    for j in results:
+        preprocessing_results[preprocessing_key(j)] = {k: j[k] for k in scripts.analyze_file.preprocessing_keys if k in j}
+
+    # with a prelude, the baseline is measured once per config (and run) and reused
+    def prelude_baseline_key(j):
+        return "\n".join([j["prelude"], j["compiler"]] + j["args"] + j["include_dirs"])
+
+    prelude_baselines = {}
+
+    shared_preprocessing = 0
+    new_failures = []
+    failed_refinements = 0
+
     done = 0
     for j in to_execute:
+        if budget is not None and job_durations:
+            # stop if the average job does not fit into the remaining budget anymore
+            average = sum(job_durations) / len(job_durations)
+            if time.time() - start_time + average > 60 * budget:
+                print("budget exhausted, {} jobs left".format(len(to_execute) - done))
+                break
+        job_start = time.time()
         id = j["cache-key"]
         compiler_args = j["args"]
-        print("[{}/{}] executing '{} {}' for file {}".format(done, len(to_execute), j['compiler_name'], j['variant'], j['file']))
-        res = scripts.analyze_file.run(j['file'], j["include_dirs"], dest_dir, j['compiler'], j['compiler_type'], compiler_args, not verbose, verbose)
+        pkey = preprocessing_key(j)
+        preprocessing = preprocessing_results.get(pkey)
+        if j["id"] in refining:
+            preprocessing = None  # refined as well
+        if preprocessing is not None:
+            shared_preprocessing += 1
+        prelude_baseline = None
+        if j.get("prelude") and j["id"] not in refining:
+            prelude_baseline = prelude_baselines.get(prelude_baseline_key(j))
+        print("[{}/{}] {} '{} {}' for file {}".format(done, len(to_execute), "refining" if j["id"] in refining else "executing",
+                                                     j['compiler_name'], j['variant'], j['file']))
+        try:
+            res = scripts.analyze_file.run(j['file'], j["include_dirs"], dest_dir, j['compiler'], j['compiler_type'],
+                                           compiler_args, not verbose, verbose, preprocessing=preprocessing,
+                                           usage=j.get("usage"),
+                                           link_objects=link_objects, linker=linker, link_usage=link_usage(j),
+                                           cold=cold, counters=counters, concurrency=concurrency,
+                                           bypass_driver=bypass_driver, prelude=j.get("prelude"),
+                                           prelude_baseline=prelude_baseline)
+        except scripts.analyze_file.CompileError as e:
+            print("  .. failed: " + first_error_line(e.diagnostics))
+            if j["id"] in refining:
+                # a failed refinement does not invalidate the cached result
+                print("  .. keeping the cached result")
+                failed_refinements += 1
+                done += 1
+                continue
+            job_cache[id] = {
+                "failed": True,
+                "error": first_error_line(e.diagnostics),
+                "command": " ".join(e.command),
+                "diagnostics": e.diagnostics,
+                "fingerprint": scripts.fingerprints.job_fingerprint(j),
+            }
+            write_cache()
+            j["error"] = job_cache[id]["error"]
+            new_failures.append(j)
+            done += 1
+            continue
 
         res = json.loads(res)
+        if j.get("prelude") and prelude_baseline is None:
+            prelude_baselines[prelude_baseline_key(j)] = {
+                k: res[k] for k in scripts.analyze_file.prelude_baseline_keys if k in res}
+        for k in scripts.estimate_jobs.metadata_keys:
+            res[k] = j[k]
+        res["args"] = j["args"]
+        if j.get("usage"):
+            res["usage"] = j["usage"]
+        if j.get("prelude"):
+            res["prelude"] = j["prelude"]
+        res["measured_at"] = time.time()
+        res["compiler_fingerprint"] = scripts.fingerprints.compiler_fingerprint(j["compiler"])
+        res["host_fingerprint"] = host_fingerprint
+        if j["compiler"] in calibration:
+            res["calibration"] = calibration[j["compiler"]]
+        if id in job_cache and not job_cache[id].get("failed"):
+            res = merge_results(job_cache[id], res)
+        preprocessing_results[pkey] = {k: res[k] for k in scripts.analyze_file.preprocessing_keys if k in res}
         job_cache[id] = res
 
-        # write cache
-        if os.path.exists(cache_file):
-            shutil.copy(cache_file, cache_file + ".prev")
-        with open(cache_file, "w") as f:
-            json.dump(job_cache, f, indent=4)
+        write_cache()
+        if history is not None:
+            scripts.history_db.add_measurement(history, j, res)
 
         for k in res:
             j[k] = res[k]
 
-        results.append(j)
+        if j["id"] not in refining:
+            results.append(j)
         done += 1
+        job_durations.append(time.time() - job_start)
+
+    print("reused preprocessing results for {} of {} executed jobs".format(shared_preprocessing, len(to_execute)))
 
+    # estimated results are not cached, so that later runs replace them by real measurements
+    if to_estimate:
+        observations = [r for r in job_cache.values() if not r.get("failed")] + results
+        estimated = scripts.estimate_jobs.estimate_results(to_estimate, observations, result_columns)
+        for (j, est) in estimated:
+            for k in est:
+                j[k] = est[k]
+            results.append(j)
+        print("estimated {} jobs ({} could not be estimated due to missing reference measurements)".format(
+            len(estimated), len(to_estimate) - len(estimated)))
+
+    # failure summary
+    if failed_refinements:
+        print("{} refinements failed (cached results kept)".format(failed_refinements))
+
+    if new_failures or known_failures:
+        print("")
+        print("{} jobs failed ({} new, {} known from cache):".format(
+            len(new_failures) + len(known_failures), len(new_failures), len(known_failures)))
+        for j in new_failures + known_failures:
+            print("  {} {} '{}' ({} {}): {}".format(
+                j["project"], j["version"], j["file"], j["compiler_name"], j["variant"], j["error"]))
+
+    if reference is not None:
+        uncalibrated = [j for j in results if "calibration" not in j or j["compiler"] not in reference]
+        if uncalibrated:
+            print("omitting {} results without calibration from the normalized data".format(len(uncalibrated)))
 
     # write after
+    results.sort(key=lambda j: j["id"])
     with open(dest_file, "w") as f:
-        json.dump(build_result_data(results), f)
+        json.dump(build_result_data(results, reference=reference), f)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -181,7 +608,30 @@ if __name__ == '__main__':
                         help="temporary directory to use (e.g. /tmp)")
     parser.add_argument("-v", "--verbose", help="increase output verbosity",
                         action="store_true")
+    parser.add_argument("--retry-failed", help="retry jobs that are known to fail",
+                        action="store_true")
+    parser.add_argument("--history", help="sqlite database that stores every measurement")
+    parser.add_argument("--estimate", help="only measure a representative subset of configs per file and estimate the rest",
+                        action="store_true")
+    parser.add_argument("--link", type=int, default=0, metavar="N",
+                        help="also measure linking N objects that include the same file")
+    parser.add_argument("--linker", help="linker for the link stage (e.g. gold or lld)")
+    parser.add_argument("--cold", help="also measure compile times with the includes evicted from the page cache",
+                        action="store_true")
+    parser.add_argument("--counters", help="also record instructions, cycles, and page faults (via perf if available)",
+                        action="store_true")
+    parser.add_argument("--concurrency", type=int, nargs="?", const=os.cpu_count(), default=0, metavar="K",
+                        help="also measure throughput of 1, 2, 4, ... up to K simultaneous compiles (default: all cores)")
+    parser.add_argument("--bypass-driver", help="also time the subcommands of the compiler driver (e.g. cc1plus, as) directly",
+                        action="store_true")
+    parser.add_argument("--budget", type=float, metavar="MINUTES",
+                        help="execute missing jobs and refine cached results until the time budget is used up")
+    parser.add_argument("--normalize", nargs="?", const="", metavar="HOST",
+                        help="normalize timings of all hosts to the calibration of HOST (default: this host)")
 
     args = parser.parse_args()
 
-    run(args.file, args.result, args.dir, args.cache, args.verbose)
\ No newline at end of file
+    run(args.file, args.result, args.dir, args.cache, args.verbose, retry_failed=args.retry_failed,
+        history_file=args.history, estimate=args.estimate, link_objects=args.link, linker=args.linker,
+        cold=args.cold, counters=args.counters, concurrency=args.concurrency,
+        bypass_driver=args.bypass_driver, budget=args.budget, normalize=args.normalize)
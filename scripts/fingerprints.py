@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import platform
+
+compiler_fingerprints = {}
+toolchain_fingerprints = {}
+directory_fingerprints = {}  # per run (see execute_jobs.run), directories are shared by many jobs
+
+
+def compiler_fingerprint(compiler):
+    # the driver is usually a symlink, so the resolved binary is hashed by path, size, and mtime
+    if compiler not in compiler_fingerprints:
+        path = os.path.realpath(compiler)
+        st = os.stat(path)
+        h = hashlib.sha1()
+        h.update("{}:{}:{}".format(path, st.st_size, st.st_mtime_ns).encode("utf-8"))
+        compiler_fingerprints[compiler] = h.hexdigest()
+    return compiler_fingerprints[compiler]
+
+
+def toolchain_fingerprint(compiler):
+    # unlike compiler_fingerprint, this only depends on the content and thus matches across machines
+    if compiler not in toolchain_fingerprints:
+        h = hashlib.sha1()
+        with open(os.path.realpath(compiler), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        toolchain_fingerprints[compiler] = h.hexdigest()
+    return toolchain_fingerprints[compiler]
+
+
+def cpu_model():
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo", "r") as f:
+            for l in f:
+                if l.startswith("model name"):
+                    return l.partition(":")[2].strip()
+    return platform.processor() or platform.machine()
+
+
+def host_info():
+    # hardware that influences timings (the host name is only informative)
+    info = {
+        "name": platform.node(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu": cpu_model(),
+        "cpu_count": os.cpu_count(),
+    }
+    h = hashlib.sha1()
+    for k in ["system", "machine", "cpu", "cpu_count"]:
+        h.update("{}={}\n".format(k, info[k]).encode("utf-8"))
+    info["fingerprint"] = h.hexdigest()
+    return info
+
+
+def directory_fingerprint(directory):
+    if directory not in directory_fingerprints:
+        h = hashlib.sha1()
+        if not os.path.isdir(directory):
+            h.update("missing:{}\n".format(directory).encode("utf-8"))
+        else:
+            for (dirname, dirs, files) in os.walk(directory):
+                dirs.sort()
+                for f in sorted(files):
+                    fpath = os.path.join(dirname, f)
+                    st = os.stat(fpath)
+                    h.update("{}:{}:{}\n".format(os.path.relpath(fpath, directory), st.st_size,
+                                                 st.st_mtime_ns).encode("utf-8"))
+        directory_fingerprints[directory] = h.hexdigest()
+    return directory_fingerprints[directory]
+
+
+def job_fingerprint(job):
+    # everything that can change the outcome of compiling a job
+    h = hashlib.sha1()
+    h.update(compiler_fingerprint(job["compiler"]).encode("utf-8"))
+    h.update("\n".join(job["args"]).encode("utf-8"))
+    for d in job["include_dirs"]:
+        h.update(directory_fingerprint(d).encode("utf-8"))
+    return h.hexdigest()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+
+import scripts.execute_jobs
+import scripts.generate_jobs
+
+# metrics that are reported as cost over the baseline
+sweep_metrics = ["compile_time", "object_size"]
+
+
+def median(vs):
+    vs = sorted(vs)
+    return vs[len(vs) // 2]
+
+
+def run(sweep_file, dest_dir, dest_file, *, project=None, verbose=False):
+
+    with open(sweep_file, "r") as f:
+        sweep = json.load(f)
+    axes = sweep["axes"]
+
+    sweep_configs = list(scripts.generate_jobs.generate_sweep_configs(sweep))
+    point_of = {c.variant: point for (c, point) in sweep_configs}
+    base = sweep_configs[0][0]
+    print("sweeping {} flag combinations of {} {} C++{} ({})".format(
+        len(sweep_configs), base.compiler_name, base.variant, base.cpp, " ".join(base.args)))
+
+    # ===============================================
+    # measure (via the shared job cache)
+
+    jobs_file = os.path.join(dest_dir, "sweep-jobs.json")
+    data_file = os.path.join(dest_dir, "sweep-data.json")
+    cache_file = os.path.join(dest_dir, "job-cache.json")
+
+    scripts.generate_jobs.run(jobs_file, dest_dir, project, None, verbose, configs=[c for (c, _) in sweep_configs])
+    scripts.execute_jobs.run(jobs_file, data_file, dest_dir, cache_file, verbose)
+
+    with open(data_file, "r") as f:
+        data = json.load(f)
+    col_idx = {c: i for i, c in enumerate(data["columns"])}
+    variant_points = [point_of[v["name"]] for v in data["variants"]]
+
+    # (project, version, file) -> flag combination -> cost over baseline
+    values = {}
+    for p in data["projects"]:
+        for f in p["files"]:
+            fv = values.setdefault((p["name"], p["version"], f["name"]), {})
+            for r in f["results"]:
+                fv[variant_points[r[0]]] = {m: r[col_idx[m]] - r[col_idx[m + "_base"]] for m in sweep_metrics}
+
+    # ===============================================
+    # per-flag deltas
+    # (compares each combination with the one that only differs in having the base value of the axis)
+
+    flags = []
+    for (a, axis) in enumerate(axes):
+        for v in range(1, len(axis["values"]) + 1):
+            entries = []
+            for (key, fv) in values.items():
+                for (point, res) in fv.items():
+                    if point[a] != v:
+                        continue
+                    ref = fv.get(point[:a] + (0,) + point[a + 1:])
+                    if ref is None:
+                        continue
+                    entry = {
+                        "project": key[0],
+                        "version": key[1],
+                        "file": key[2],
+                    }
+                    for m in sweep_metrics:
+                        entry[m] = res[m] - ref[m]
+                        entry[m + "_relative"] = entry[m] / abs(ref[m]) if ref[m] != 0 else None
+                    entries.append(entry)
+            label = scripts.generate_jobs.sweep_value_label(axis, v)
+            if not entries:
+                print("no results for {}: {} (all jobs failed?)".format(axis["name"], label))
+                continue
+
+            entries.sort(key=lambda e: -abs(e["compile_time"]))
+            flag = {
+                "axis": axis["name"],
+                "flags": label,
+                "files": len(entries),
+                "entries": entries,
+            }
+            for m in sweep_metrics:
+                flag[m] = median([e[m] for e in entries])
+                rels = [e[m + "_relative"] for e in entries if e[m + "_relative"] is not None]
+                flag[m + "_relative"] = median(rels) if rels else None
+            flags.append(flag)
+
+    flags.sort(key=lambda f: -abs(f["compile_time"]))
+
+    def format_relative(r):
+        return "({:+.1f}%)".format(100 * r) if r is not None else ""
+
+    print("")
+    print("median cost over the baseline compared to the base config:")
+    print("{:>12} {:>9} {:>14} {:>9} {:>6}  flags".format("compile [ms]", "", "object [bytes]", "", "files"))
+    for f in flags:
+        print("{:>+12} {:>9} {:>+14} {:>9} {:>6}  {}: {}".format(
+            f["compile_time"], format_relative(f["compile_time_relative"]),
+            f["object_size"], format_relative(f["object_size_relative"]),
+            f["files"], f["axis"], f["flags"]))
+
+    if dest_file:
+        with open(dest_file, "w") as f:
+            json.dump({"base": " ".join(base.args), "flags": flags}, f, indent=4)
+
+    return flags
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure which compiler flags drive the compile cost of headers")
+    parser.add_argument("sweep", metavar="S", help="sweep definition (e.g. sweeps/flags.json)")
+    parser.add_argument("-d", "--dir", required=True,
+                        help="directory to work in (the same as for generate_data.py)")
+    parser.add_argument("-p", "--project", help="only sweep a specific project (e.g. -p fmt)")
+    parser.add_argument("-o", "--json", help="write per-flag and per-file deltas to this json file")
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    run(args.sweep, args.dir, args.json, project=args.project, verbose=args.verbose)
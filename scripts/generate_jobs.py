@@ -2,6 +2,8 @@
 
 import re
 import glob
+import concurrent.futures
+import itertools
 import os
 import argparse
 import subprocess
@@ -9,160 +11,499 @@ import platform
 import shutil
 import distutils.dir_util
 import json
+import shlex
+import time
+import hashlib
 from pathlib import Path
 
+import scripts.fingerprints
+
 if any(platform.win32_ver()):
     import scripts.find_visual_studio
 
-def run(dest_file, dest_dir, project, max_num_configs, verbose):
-    def debug_print(s):
-        if verbose:
-            print(s)
+is_windows = any(platform.win32_ver())
+is_linux = not is_windows
+
+
+class Config:
+    cpp = None
+    args = None
+    compiler = None
+    compiler_name = None
+    variant = None
+    compiler_type = None
+
+    def __init__(self):
+        self.args = []
+
+
+def generate_configs():
+
+    msvc_variants = [
+        ['Debug', ['/Od', '/Ob0', '/MDd', '/GS', '/DWIN32', '/D_WINDOWS']],
+        ['RelWithDebInfo', ['/O2', '/Ob1', '/MD', '/GS', '/DWIN32', '/D_WINDOWS', '/DNDEBUG']],
+        ['Release', ['/O2', '/Ob2', '/MD', '/GS', '/DWIN32', '/D_WINDOWS', '/DNDEBUG']],
+    ]
+    
+    gcc_variants = [
+        ["Debug", ['-O0', '-g']],
+        ["RelWithDebInfo", ['-O2', '-g', '-DNDEBUG']],
+        ["Release", ['-O3', '-DNDEBUG']],
+    ]
+
+    def make_cpp_arg(cpp, compiler_type):
+        if compiler_type == 'msvc':
+            return "/std:c++{}".format(cpp)
+        elif compiler_type == 'gcc':
+            return "-std=c++{}".format(cpp)
+        else:
+            assert False, "Unkown compiler type"
 
-    # ===============================================================
-    # framework
 
+    if is_windows:
+        def get_absolute_path(prog):
+            return subprocess.check_output(['where.exe', prog]).decode('utf-8').splitlines()[0]
+        
+        for vs_version in [2019, 2017, 2015]:
+            vs_path = scripts.find_visual_studio.run(vs_version)
+            if vs_path is not None:
 
-    is_windows = any(platform.win32_ver())
-    is_linux = not is_windows
+                def execute_and_steal_environment(args):
+                    null = open(os.devnull, 'w')
+                    environment = subprocess.check_output(args + ['&&', 'set'], stderr=null)
+                    for env in environment.splitlines():
+                        k, _, v = map(str.strip, env.decode('utf-8').strip().partition('='))
+                        if k.startswith('?'):
+                            continue
+                        os.environ[k] = v
 
+                is_64_bit = platform.machine().endswith('64')
+                toolst_arch = 'x64' if is_64_bit else 'x86'
 
-    class Config:
-        cpp = None
-        args = None
-        compiler = None
-        compiler_name = None
-        variant = None
-        compiler_type = None
+                vcvarsall_path = vs_path / Path('VC/Auxiliary/Build/vcvarsall.bat')
+                assert vcvarsall_path.exists(), 'could not find vcvarsall.bat'
+                execute_and_steal_environment([vcvarsall_path, toolst_arch, toolst_arch])
 
-        def __init__(self):
-            self.args = []
+                cl_path = get_absolute_path('cl.exe')
 
+                cc = ['Visual Studio {}'.format(vs_version), cl_path]
+                
+                for cpp in [14, 17]:
+                    for variant in msvc_variants:
+                        c = Config()
+                        c.cpp = cpp
+                        c.args = variant[1] + [make_cpp_arg(cpp, 'msvc')]
+                        c.variant = variant[0]
+                        c.compiler = cc[1]
+                        c.compiler_name = cc[0]
+                        c.compiler_type = 'msvc'
+                        yield c
+
+                break
+        
+        for cc in [
+            ['Clang', get_absolute_path('clang.exe'), 'gcc', gcc_variants],
+            ['Clang-Cl', get_absolute_path('clang-cl.exe'), 'msvc', msvc_variants]
+        ]:
+            if not os.path.exists(cc[1]):
+                continue
+            
+            for cpp in [11, 14, 17]:
+                for variant in cc[3]:
+                    if cc[1] is not None:
+                        c = Config()
+                        c.cpp = cpp
+                        c.args = variant[1] + [make_cpp_arg(cpp, cc[2])]
+                        c.variant = variant[0]
+                        c.compiler = cc[1]
+                        c.compiler_name = cc[0]
+                        c.compiler_type = cc[2]
+                        yield c
+    elif is_linux:
+        for cc in [
+            ['Clang 6', '/usr/bin/clang++-6'],
+            ['Clang 7', '/usr/bin/clang++-7'],
+            ['Clang 8', '/usr/bin/clang++-8'],
+            ['Clang 9', '/usr/bin/clang++-9'],
+            ['GCC 7', '/usr/bin/g++-7'],
+            ['GCC 8', '/usr/bin/g++-8'],
+            ['GCC 9', '/usr/bin/g++-9'],
+        ]:
+            if not os.path.exists(cc[1]):
+                continue
 
-    def generate_configs():
+            for libcpp in [False, True]:
+                if libcpp and not cc[0].startswith("Clang"):
+                    continue
 
-        msvc_variants = [
-            ['Debug', ['/Od', '/Ob0', '/MDd', '/GS', '/DWIN32', '/D_WINDOWS']],
-            ['RelWithDebInfo', ['/O2', '/Ob1', '/MD', '/GS', '/DWIN32', '/D_WINDOWS', '/DNDEBUG']],
-            ['Release', ['/O2', '/Ob2', '/MD', '/GS', '/DWIN32', '/D_WINDOWS', '/DNDEBUG']],
-        ]
-        
-        gcc_variants = [
-            ["Debug", ['-O0', '-g']],
-            ["RelWithDebInfo", ['-O2', '-g', '-DNDEBUG']],
-            ["Release", ['-O3', '-DNDEBUG']],
-        ]
-
-        def make_cpp_arg(cpp, compiler_type):
-            if compiler_type == 'msvc':
-                return "/std:c++{}".format(cpp)
-            elif compiler_type == 'gcc':
-                return "-std=c++{}".format(cpp)
+                if libcpp:
+                    continue  # TODO: install multiple versions
+
+                extra_args = []
+                var_suffix = ""
+                if libcpp:
+                    extra_args.append('-stdlib=libc++')
+                    var_suffix = " (libc++)"
+
+                for cpp in [11, 14, 17]:
+                    for variant in gcc_variants:
+                        c = Config()
+                        c.cpp = cpp
+                        c.args = variant[1] + extra_args + ["-march=skylake", make_cpp_arg(cpp, 'gcc')]
+                        c.variant = variant[0] + var_suffix
+                        c.compiler = cc[1]
+                        c.compiler_name = cc[0]
+                        c.compiler_type = 'gcc'
+                        yield c
+
+    else:
+        assert False, "unknown platform"
+
+
+def verbose_print(verbose, s):
+    if verbose:
+        print(s)
+
+
+def get_repo_dir(url, dest_dir, verbose=False):
+    # returns the local mirror of a git repo (cloned on first use)
+    urltype = None
+    # e.g. https://github.com/boostorg/config
+    if url.startswith("https://github.com"):
+        urltype = "github"
+        m = re.fullmatch(r"https://github\.com/([\w-]+)/([\w-]+)/?", url)
+        assert m is not None, "malformed url"
+        user = m.group(1)
+        proj = m.group(2)
+
+    # e.g. https://gitlab.com/libeigen/eigen
+    elif url.startswith("https://gitlab.com"):
+        urltype = "gitlab"
+        m = re.fullmatch(r"https://gitlab\.com/([\w-]+)/([\w-]+)", url)
+        assert m is not None, "malformed url"
+        user = m.group(1)
+        proj = m.group(2)
+
+    # e.g. https://graphics.rwth-aachen.de:9000/OpenMesh/OpenMesh
+    elif url.startswith("https://graphics.rwth-aachen.de:9000"):
+        urltype = "rwth-graphics"
+        m = re.fullmatch(
+            r"https://graphics\.rwth-aachen\.de:9000/([\w-]+)/([\w-]+)", url)
+        assert m is not None, "malformed url"
+        user = m.group(1)
+        proj = m.group(2)
+
+    else:
+        assert False, "unknown/unsupported repo"
+
+    repo_dir = os.path.join(dest_dir, "repos", urltype, user, proj)
+    verbose_print(verbose, "      .. repo in " + repo_dir)
+    if not os.path.exists(repo_dir):
+        git_args = ["git", "clone", url, repo_dir]
+        verbose_print(verbose, "      .. running {}".format(git_args))
+        subprocess.check_call(git_args)
+
+    return repo_dir
+
+
+def resolve_repo_ref(url, ref, dest_dir, *, fetch_ttl, fetched_repos, verbose=False):
+    # returns the commit sha of a branch, tag, or sha in the local mirror
+    # (fetched at most once per run and only if the last fetch is older than fetch_ttl minutes)
+    repo_dir = get_repo_dir(url, dest_dir, verbose)
+
+    if not url in fetched_repos:
+        fetch_head = os.path.join(repo_dir, ".git", "FETCH_HEAD")
+        if os.path.exists(fetch_head) and time.time() - os.path.getmtime(fetch_head) < 60 * fetch_ttl:
+            verbose_print(verbose, "      .. skipping git fetch (last fetch {:.0f} min ago)".format(
+                (time.time() - os.path.getmtime(fetch_head)) / 60))
+        else:
+            verbose_print(verbose, "      .. git fetch")
+            subprocess.check_call(["git", "fetch"], cwd=repo_dir)
+        fetched_repos.add(url)
+
+    # remote branches first, the local branch of a mirror is never updated
+    for r in ["refs/remotes/origin/" + ref, ref]:
+        p = subprocess.run(["git", "rev-parse", "--verify", "-q", r + "^{commit}"], cwd=repo_dir,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if p.returncode == 0:
+            return p.stdout.decode("utf-8").strip()
+    assert False, "unknown ref {} in {}".format(ref, url)
+
+
+def get_repo_files(url, version, base_dir, target_dir, dest_dir, *, fetched_repos, verbose=False):
+    verbose_print(verbose, "      .. getting files from " + url)
+
+    repo_dir = get_repo_dir(url, dest_dir, verbose)
+
+    if not url in fetched_repos:  # only fetch once
+        verbose_print(verbose, "      .. git fetch")
+        subprocess.check_call(["git", "fetch"], cwd=repo_dir)
+        fetched_repos.add(url)
+
+    verbose_print(verbose, "      .. getting version " + version)
+    subprocess.check_call(["git", "checkout", version], cwd=repo_dir)
+
+    src_dir = os.path.join(repo_dir, base_dir)
+    verbose_print(verbose, "      .. copy {} to {}".format(src_dir, target_dir))
+
+    distutils.dir_util.copy_tree(src_dir, target_dir)
+
+
+cpp_std_versions = {
+    "c++11": 11, "c++0x": 11, "gnu++11": 11, "gnu++0x": 11,
+    "c++14": 14, "c++1y": 14, "gnu++14": 14, "gnu++1y": 14,
+    "c++17": 17, "c++1z": 17, "gnu++17": 17, "gnu++1z": 17,
+    "c++20": 20, "c++2a": 20, "gnu++20": 20, "gnu++2a": 20,
+}
+
+
+def parse_compile_commands(path):
+    # returns one entry per TU with its (absolute) source, original arguments, and the
+    # preprocessor-relevant flags (standard, include dirs, defines, forced includes)
+    with open(path, "r") as f:
+        commands = json.load(f)
+
+    tus = []
+    for cmd in commands:
+        directory = cmd["directory"]
+        if "arguments" in cmd:
+            cargs = cmd["arguments"]
+        else:
+            cargs = shlex.split(cmd["command"])
+
+        tu = {
+            "file": os.path.normpath(os.path.join(directory, cmd["file"])),
+            "directory": directory,
+            "arguments": cargs,
+            "cpp": None,
+            "include_dirs": [],
+            "system_include_dirs": [],
+            "quote_include_dirs": [],
+            "after_include_dirs": [],
+            "defines": [],
+        }
+
+        def abspath(d):
+            return os.path.normpath(os.path.join(directory, d))
+
+        i = 1  # skip compiler
+        while i < len(cargs):
+            a = cargs[i]
+            # flags with separate values are joined (e.g. "-I" "dir" to "-Idir")
+            if a in ["-I", "-isystem", "-iquote", "-idirafter", "-D", "-U", "-include"] and i + 1 < len(cargs):
+                i += 1
+                a = a + cargs[i]
+            if a.startswith("-I"):
+                tu["include_dirs"].append(abspath(a[len("-I"):]))
+            elif a.startswith("-isystem"):
+                tu["system_include_dirs"].append(abspath(a[len("-isystem"):]))
+            elif a.startswith("-iquote"):
+                tu["quote_include_dirs"].append(abspath(a[len("-iquote"):]))
+            elif a.startswith("-idirafter"):
+                tu["after_include_dirs"].append(abspath(a[len("-idirafter"):]))
+            elif a.startswith("-include"):
+                tu["defines"] += ["-include", abspath(a[len("-include"):])]
+            elif a.startswith("-D") or a.startswith("-U"):
+                tu["defines"].append(a)
+            elif a.startswith("-std="):
+                tu["cpp"] = cpp_std_versions.get(a[len("-std="):])
+            i += 1
+
+        tus.append(tu)
+    return tus
+
+
+def find_config(compiler_name=None, variant=None, cpp=None, min_cpp=11):
+    # returns the first config matching the given filters
+    for c in generate_configs():
+        if compiler_name is not None and c.compiler_name != compiler_name:
+            continue
+        if variant is not None and c.variant != variant:
+            continue
+        if cpp is not None and c.cpp != cpp:
+            continue
+        if c.cpp < min_cpp:
+            continue
+        return c
+    assert False, "no matching config found"
+
+
+def sweep_value_label(axis, v):
+    # value index 0 is the unchanged base config, v > 0 is axis["values"][v - 1]
+    if v == 0:
+        return "base"
+    flags = axis["values"][v - 1]
+    if "replace" not in axis:
+        return " ".join(flags)
+    if not flags:
+        return "no " + axis["replace"]
+    return "{} instead of {}".format(" ".join(flags), axis["replace"])
+
+
+def generate_sweep_configs(sweep):
+    # yields (config, value index per axis) for the flag combinations of a sweep (see sweeps/flags.json)
+    # "one-at-a-time" only changes a single axis of the base config, "full" uses all combinations
+    base_cfg = sweep.get("base", {})
+    base = find_config(base_cfg.get("compiler"), base_cfg.get("variant"), base_cfg.get("cpp"))
+    axes = sweep["axes"]
+
+    mode = sweep.get("mode", "one-at-a-time")
+    if mode == "one-at-a-time":
+        points = [tuple([0] * len(axes))]
+        for (a, axis) in enumerate(axes):
+            for v in range(1, len(axis["values"]) + 1):
+                points.append(tuple(v if i == a else 0 for i in range(len(axes))))
+    elif mode == "full":
+        points = list(itertools.product(*[range(len(axis["values"]) + 1) for axis in axes]))
+    else:
+        assert False, "unknown sweep mode " + mode
+
+    for point in points:
+        args = list(base.args)
+        labels = []
+        for (axis, v) in zip(axes, point):
+            if v == 0:
+                continue
+            flags = axis["values"][v - 1]
+            if "replace" in axis:
+                assert axis["replace"] in args, "'{}' is not an argument of the base config".format(axis["replace"])
+                i = args.index(axis["replace"])
+                args[i:i + 1] = flags
             else:
-                assert False, "Unkown compiler type"
+                args += flags
+            labels.append(sweep_value_label(axis, v))
+
+        c = Config()
+        c.cpp = base.cpp
+        c.args = args
+        c.variant = base.variant if not labels else "{} [{}]".format(base.variant, ", ".join(labels))
+        c.compiler = base.compiler
+        c.compiler_name = base.compiler_name
+        c.compiler_type = base.compiler_type
+        yield c, point
+
+
+def is_glob_pattern(f):
+    return any(c in f for c in "*?[")
+
+
+def expand_file_patterns(patterns, src_dir):
+    # returns the files (relative to src_dir) matching any of the glob patterns (** matches subdirectories)
+    files = set()
+    for pattern in patterns:
+        for fpath in glob.glob(os.path.join(src_dir, pattern), recursive=True):
+            if os.path.isfile(fpath):
+                files.add(os.path.relpath(fpath, src_dir).replace(os.sep, "/"))
+    return sorted(files)
+
+
+def check_self_contained(files, config, extra_args, include_dirs, version, cache_file, jobs=None, *, commits=None):
+    # returns {file: error} for files that do not compile on their own (-fsyntax-only)
+    # results are cached per version (and its commits, see resolve_repo_ref), file, compiler, and args
+    assert config.compiler_type == 'gcc', "self-containedness check is only supported for gcc-style compilers"
+
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+
+    cargs = config.args + extra_args
+    for d in include_dirs:
+        cargs = cargs + ["-I" + d]
+
+    revision = []
+    if commits is not None:
+        revision.append("commit=" + commits["commit"])
+        revision += ["dep=" + sha for (_, sha) in sorted(commits.get("dependencies", {}).items())]
+
+    def key(f):
+        return ":".join([version] + revision + [f, config.compiler] + config.args + extra_args)
+
+    def check(f):
+        p = subprocess.run([config.compiler] + cargs + ["-fsyntax-only", "-x", "c++", "-"],
+                           input="#include <{}>\n".format(f).encode("utf-8"),
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if p.returncode == 0:
+            return None
+        lines = p.stdout.decode("utf-8", errors="replace").splitlines()
+        errors = [l for l in lines if "error" in l]
+        return errors[0] if errors else (lines[0] if lines else "(no diagnostics)")
+
+    unchecked = [f for f in files if key(f) not in cache]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        for (f, error) in zip(unchecked, executor.map(check, unchecked)):
+            cache[key(f)] = {"error": error}
+
+    if unchecked:
+        with open(cache_file, "w") as f:
+            json.dump(cache, f, indent=4)
+
+    return {f: cache[key(f)]["error"] for f in files if cache[key(f)]["error"] is not None}
+
+
+def find_project_config(project):
+    # returns (cfg, category, libpath) of a project in libs/
+    for cat in sorted(os.listdir("libs")):
+        cfgpath = os.path.join("libs", cat, project, "project.json")
+        if os.path.exists(cfgpath):
+            with open(cfgpath, "r") as f:
+                return json.load(f), cat, os.path.join("libs", cat, project)
+    assert False, "unknown project " + project
 
 
-        if is_windows:
-            def get_absolute_path(prog):
-                return subprocess.check_output(['where.exe', prog]).decode('utf-8').splitlines()[0]
-            
-            for vs_version in [2019, 2017, 2015]:
-                vs_path = scripts.find_visual_studio.run(vs_version)
-                if vs_path is not None:
-
-                    def execute_and_steal_environment(args):
-                        null = open(os.devnull, 'w')
-                        environment = subprocess.check_output(args + ['&&', 'set'], stderr=null)
-                        for env in environment.splitlines():
-                            k, _, v = map(str.strip, env.decode('utf-8').strip().partition('='))
-                            if k.startswith('?'):
-                                continue
-                            os.environ[k] = v
-
-                    is_64_bit = platform.machine().endswith('64')
-                    toolst_arch = 'x64' if is_64_bit else 'x86'
-
-                    vcvarsall_path = vs_path / Path('VC/Auxiliary/Build/vcvarsall.bat')
-                    assert vcvarsall_path.exists(), 'could not find vcvarsall.bat'
-                    execute_and_steal_environment([vcvarsall_path, toolst_arch, toolst_arch])
-
-                    cl_path = get_absolute_path('cl.exe')
-
-                    cc = ['Visual Studio {}'.format(vs_version), cl_path]
-                    
-                    for cpp in [14, 17]:
-                        for variant in msvc_variants:
-                            c = Config()
-                            c.cpp = cpp
-                            c.args = variant[1] + [make_cpp_arg(cpp, 'msvc')]
-                            c.variant = variant[0]
-                            c.compiler = cc[1]
-                            c.compiler_name = cc[0]
-                            c.compiler_type = 'msvc'
-                            yield c
+def list_project_files(cfg, libpath, verbose=False):
+    # yields (version, version path, relative file path) for all sources and headers of a "file" project
+    for v in os.listdir(libpath):
+        vpath = libpath + "/" + v
+        if not os.path.isdir(vpath):
+            continue
 
-                    break
-            
-            for cc in [
-                ['Clang', get_absolute_path('clang.exe'), 'gcc', gcc_variants],
-                ['Clang-Cl', get_absolute_path('clang-cl.exe'), 'msvc', msvc_variants]
-            ]:
-                if not os.path.exists(cc[1]):
+        verbose_print(verbose, "      " + vpath)
+
+        for (dirname, _, files) in os.walk(vpath):
+            for f in files:
+                fpath = dirname + "/" + f
+                rfpath = fpath[len(vpath)+1:]
+                if not os.path.isfile(fpath):
                     continue
-                
-                for cpp in [11, 14, 17]:
-                    for variant in cc[3]:
-                        if cc[1] is not None:
-                            c = Config()
-                            c.cpp = cpp
-                            c.args = variant[1] + [make_cpp_arg(cpp, cc[2])]
-                            c.variant = variant[0]
-                            c.compiler = cc[1]
-                            c.compiler_name = cc[0]
-                            c.compiler_type = cc[2]
-                            yield c
-        elif is_linux:
-            for cc in [
-                ['Clang 6', '/usr/bin/clang++-6'],
-                ['Clang 7', '/usr/bin/clang++-7'],
-                ['Clang 8', '/usr/bin/clang++-8'],
-                ['Clang 9', '/usr/bin/clang++-9'],
-                ['GCC 7', '/usr/bin/g++-7'],
-                ['GCC 8', '/usr/bin/g++-8'],
-                ['GCC 9', '/usr/bin/g++-9'],
-            ]:
-                if not os.path.exists(cc[1]):
+
+                if "whitelist" in cfg and not rfpath in cfg["whitelist"]:
+                    verbose_print(verbose, "      " + fpath + " (" + rfpath + ") - IGNORED")
                     continue
 
-                for libcpp in [False, True]:
-                    if libcpp and not cc[0].startswith("Clang"):
-                        continue
-
-                    if libcpp:
-                        continue  # TODO: install multiple versions
-
-                    extra_args = []
-                    var_suffix = ""
-                    if libcpp:
-                        extra_args.append('-stdlib=libc++')
-                        var_suffix = " (libc++)"
-
-                    for cpp in [11, 14, 17]:
-                        for variant in gcc_variants:
-                            c = Config()
-                            c.cpp = cpp
-                            c.args = variant[1] + extra_args + ["-march=skylake", make_cpp_arg(cpp, 'gcc')]
-                            c.variant = variant[0] + var_suffix
-                            c.compiler = cc[1]
-                            c.compiler_name = cc[0]
-                            c.compiler_type = 'gcc'
-                            yield c
+                verbose_print(verbose, "      " + fpath + " (" + rfpath + ")")
 
-        else:
-            assert False, "unknown platform"
+                ext = os.path.splitext(fpath)[-1]
+                if len(ext) < 2 or ext[1] not in ['c', 'h']:
+                    continue
 
+                yield v, vpath, rfpath
 
-    all_configs = list(generate_configs())
+
+def write_jobs(dest_file, configs, projects, files, jobs):
+    # one json value per line, so that the executor can stream the jobs:
+    #   a header, then the config, project, and file tables, then one index tuple per job
+    # (use execute_jobs.read_jobs for reading)
+    with open(dest_file, "w") as f:
+        f.write(json.dumps({"format": "compile-health-jobs", "version": 2}) + "\n")
+        for (kind, table) in [("config", configs), ("project", projects), ("file", files)]:
+            for (idx, e) in enumerate(table):
+                f.write(json.dumps([kind, idx, e]) + "\n")
+        for j in jobs:
+            f.write(json.dumps(["job"] + list(j)) + "\n")
+
+
+def run(dest_file, dest_dir, project, max_num_configs, verbose, *, configs=None, fetch_ttl=60, prelude=None):
+    def debug_print(s):
+        if verbose:
+            print(s)
+
+
+    # project directories are only hashed once per run (see add_project_compile_commands)
+    scripts.fingerprints.directory_fingerprints.clear()
+
+    # configs can be given explicitly (e.g. for flag sweeps)
+    all_configs = list(generate_configs()) if configs is None else list(configs)
 
     since_cpp14_configs = [c for c in all_configs if c.cpp >= 14]
     since_cpp17_configs = [c for c in all_configs if c.cpp >= 17]
@@ -181,31 +522,61 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
     project_list = []
     project_jobs = {}
 
+    # jobs are stored normalized (see write_jobs)
+    config_table = {}
+    project_table = {}
+    file_table = {}
+
+    def intern(table, key, value):
+        if key not in table:
+            table[key] = (len(table), value)
+        return table[key][0]
 
-    def add(category, project, project_url, url, version, name, file, configs, cwd, *, extra_args=[], include_dirs=[]):
+
+    def add(category, project, project_url, url, version, name, file, configs, cwd, *, extra_args=[], include_dirs=[],
+            link_usage=None, usage=None, usage_name=None, commit=None, dependency_commits=None, prelude=prelude):
         if project not in project_jobs:
             project_list.append(project)
             project_jobs[project] = []
+        pidx = intern(project_table, (category, project, project_url), {
+            "category": category,
+            "project": project,
+            "project_url": project_url,
+        })
+        file_entry = {
+            "url": url,
+            "version": version,
+            "name": name,
+            "file": file,
+            "extra_args": extra_args,
+            "include_dirs": include_dirs,
+            "working_dir": cwd,
+        }
+        if link_usage is not None:
+            file_entry["link_usage"] = link_usage
+        if usage is not None:
+            file_entry["usage"] = usage
+            file_entry["usage_name"] = usage_name
+        if commit is not None:
+            file_entry["commit"] = commit
+        if dependency_commits:
+            file_entry["dependency_commits"] = dependency_commits
+        if prelude is not None:
+            file_entry["prelude"] = prelude
+        fidx = intern(file_table, (project, version, name, file, url, cwd, tuple(extra_args), tuple(include_dirs),
+                                   link_usage, usage, commit, tuple(sorted((dependency_commits or {}).items())),
+                                   prelude), file_entry)
         for c in configs:
-            job = {
-                "category": category,
-                "project": project,
-                "project_url": project_url,
-                "url": url,
-                "version": version,
-                "name": name,
-                "file": file,
+            cidx = intern(config_table, c, {
                 "variant": c.variant,
                 "compiler_type": c.compiler_type,
-                "args": c.args + extra_args,
+                "args": c.args,
                 "cpp": c.cpp,
-                "include_dirs": include_dirs,
                 "compiler": c.compiler,
                 "compiler_name": c.compiler_name,
-                "working_dir": cwd
-            }
-            project_jobs[project].append(job)
-            debug_print("added {}".format(job))
+            })
+            project_jobs[project].append((name, cidx, pidx, fidx))
+            debug_print("added {} {} for {} ({})".format(c.compiler_name, c.variant, file, project))
 
     # ===============================================================
     # Projects
@@ -476,44 +847,49 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
     debug_print("parsing libraries")
 
 
-    def add_project_files(cfg, cat, lib, libpath):
-        assert "url" in cfg, "project.json needs at least an URL"
-
-        for v in os.listdir(libpath):
-            vpath = libpath + "/" + v
-            if not os.path.isdir(vpath):
+    def project_usages(cfg, f):
+        # named usage snippets of a project that apply to file f, e.g.
+        #   "usage": { "format an int": "fmt::format(\"{}\", 42);" }
+        # (a snippet can also be { "code": ..., "files": [...] } to restrict it to some files)
+        for (uname, u) in sorted(cfg.get("usage", {}).items()):
+            if not isinstance(u, dict):
+                u = {"code": u}
+            if "files" in u and f not in u["files"]:
                 continue
+            code = u["code"]
+            if isinstance(code, list):
+                code = "\n".join(code)
+            yield uname, code
+
+    def project_prelude(cfg):
+        # code that precedes every file of a project and its baseline (instead of the global prelude), e.g.
+        #   "prelude": ["#include <vector>", "#include <string>"]
+        code = cfg.get("prelude", prelude)
+        if isinstance(code, list):
+            code = "\n".join(code)
+        return code
 
-            debug_print("      " + vpath)
-
-            for (dirname, _, files) in os.walk(vpath):
-                for f in files:
-                    fpath = dirname + "/" + f
-                    rfpath = fpath[len(vpath)+1:]
-                    if not os.path.isfile(fpath):
-                        continue
-
-                    if "whitelist" in cfg and not rfpath in cfg["whitelist"]:
-                        debug_print("      " + fpath +
-                                    " (" + rfpath + ") - IGNORED")
-                        continue
-
-                    debug_print("      " + fpath + " (" + rfpath + ")")
+    def add_project_files(cfg, cat, lib, libpath):
+        assert "url" in cfg, "project.json needs at least an URL"
 
-                    ext = os.path.splitext(fpath)[-1]
-                    if len(ext) < 2 or ext[1] not in ['c', 'h']:
-                        continue
+        for (v, vpath, rfpath) in list_project_files(cfg, libpath, verbose):
+            f = os.path.basename(rfpath)
 
+            furl = None
+            if "file_url_pattern" in cfg:
+                furl = cfg["file_url_pattern"].replace(
+                    "$version", v).replace("$file", rfpath)
+            if "no_url_for_files" in cfg:
+                if re.fullmatch(cfg["no_url_for_files"], f):
                     furl = None
-                    if "file_url_pattern" in cfg:
-                        furl = cfg["file_url_pattern"].replace(
-                            "$version", v).replace("$file", rfpath)
-                    if "no_url_for_files" in cfg:
-                        if re.fullmatch(cfg["no_url_for_files"], f):
-                            furl = None
 
-                    add(cat, lib, cfg["url"], furl, v,
-                        rfpath, rfpath, all_configs, vpath, include_dirs=[vpath])
+            add(cat, lib, cfg["url"], furl, v,
+                rfpath, rfpath, all_configs, vpath, include_dirs=[vpath], link_usage=cfg.get("link_usage"),
+                prelude=project_prelude(cfg))
+            for (uname, code) in project_usages(cfg, rfpath):
+                add(cat, lib, cfg["url"], furl, v,
+                    "{} [{}]".format(rfpath, uname), rfpath, all_configs, vpath, include_dirs=[vpath],
+                    usage=code, usage_name=uname, prelude=project_prelude(cfg))
 
 
     def make_github_file_url(cfg, v, f):
@@ -527,59 +903,6 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
     fetched_repos = set()
 
 
-    def get_repo_files(url, version, base_dir, target_dir):
-        debug_print("      .. getting files from " + url)
-
-        urltype = None
-        # e.g. https://github.com/boostorg/config
-        if url.startswith("https://github.com"):
-            urltype = "github"
-            m = re.fullmatch(r"https://github\.com/([\w-]+)/([\w-]+)/?", url)
-            assert m is not None, "malformed url"
-            user = m.group(1)
-            proj = m.group(2)
-
-        # e.g. https://gitlab.com/libeigen/eigen
-        elif url.startswith("https://gitlab.com"):
-            urltype = "gitlab"
-            m = re.fullmatch(r"https://gitlab\.com/([\w-]+)/([\w-]+)", url)
-            assert m is not None, "malformed url"
-            user = m.group(1)
-            proj = m.group(2)
-
-        # e.g. https://graphics.rwth-aachen.de:9000/OpenMesh/OpenMesh
-        elif url.startswith("https://graphics.rwth-aachen.de:9000"):
-            urltype = "rwth-graphics"
-            m = re.fullmatch(
-                r"https://graphics\.rwth-aachen\.de:9000/([\w-]+)/([\w-]+)", url)
-            assert m is not None, "malformed url"
-            user = m.group(1)
-            proj = m.group(2)
-
-        else:
-            assert False, "unknown/unsupported repo"
-
-        repo_dir = os.path.join(dest_dir, "repos", urltype, user, proj)
-        debug_print("      .. repo in " + repo_dir)
-        if not os.path.exists(repo_dir):
-            git_args = ["git", "clone", url, repo_dir]
-            debug_print("      .. running {}".format(git_args))
-            subprocess.check_call(git_args)
-
-        if not url in fetched_repos:  # only fetch once
-            debug_print("      .. git fetch")
-            subprocess.check_call(["git", "fetch"], cwd=repo_dir)
-            fetched_repos.add(url)
-
-        debug_print("      .. getting version " + version)
-        subprocess.check_call(["git", "checkout", version], cwd=repo_dir)
-
-        src_dir = os.path.join(repo_dir, base_dir)
-        debug_print("      .. copy {} to {}".format(src_dir, target_dir))
-
-        distutils.dir_util.copy_tree(src_dir, target_dir)
-
-
     def add_project_git(cfg, cat, lib, libpath, make_file_url):
         assert "url" in cfg, "project.json needs at least an URL"
         global args
@@ -589,41 +912,70 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
 
         lib_tmp_dir = os.path.join(dest_dir, libpath)
 
-        files = []
-        for f in cfg["files"]:
-            assert "*" not in f, "globbing not supported"
-            files.append(f)
+        # glob patterns (e.g. "boost/json/*.hpp") are expanded per version
+        files = [f for f in cfg["files"] if not is_glob_pattern(f)]
+        patterns = [f for f in cfg["files"] if is_glob_pattern(f)]
+
+        # versions (and dependency versions) are resolved to commits,
+        # only versions with missing files or a moved commit (e.g. branches) are extracted again
+        commits = {}
+        for v in cfg["versions"]:
+            commits[v] = {"commit": resolve_repo_ref(cfg["url"], v, dest_dir, fetch_ttl=fetch_ttl,
+                                                     fetched_repos=fetched_repos, verbose=verbose)}
+            for dep_url in cfg.get("dependencies", {}):
+                dep_cfg = cfg["dependencies"][dep_url]
+                assert "version" in dep_cfg
+                assert "dir" in dep_cfg
+
+                dep_version = dep_cfg["version"]
+                if dep_version == "*":
+                    dep_version = v
+                commits[v].setdefault("dependencies", {})[dep_url] = resolve_repo_ref(
+                    dep_url, dep_version, dest_dir, fetch_ttl=fetch_ttl, fetched_repos=fetched_repos, verbose=verbose)
 
         missing_versions = []
         for v in cfg["versions"]:
             any_missing = False
+            if patterns and not os.path.exists(os.path.join(lib_tmp_dir, "versions", v, "src")):
+                any_missing = True
             for f in files:
                 file_path = os.path.join(lib_tmp_dir, "versions", v, "src", f)
                 if not os.path.exists(file_path):
                     any_missing = True
                     break
+            commit_file = os.path.join(lib_tmp_dir, "versions", v, "commit.json")
+            extracted = None
+            if os.path.exists(commit_file):
+                with open(commit_file, "r") as f:
+                    extracted = json.load(f)
+            if not any_missing and extracted != commits[v]:
+                if extracted is not None:
+                    print("      {} {} moved from {} to {}".format(lib, v, extracted["commit"][:10],
+                                                                commits[v]["commit"][:10]))
+                any_missing = True
             if any_missing:
                 missing_versions.append(v)
 
         for v in missing_versions:
             debug_print("      .. getting version " + v)
 
+            # files of the previous commit must not survive
+            for d in ["src", "deps"]:
+                if os.path.exists(os.path.join(lib_tmp_dir, "versions", v, d)):
+                    shutil.rmtree(os.path.join(lib_tmp_dir, "versions", v, d))
+
             version_dir = os.path.join(lib_tmp_dir, "versions", v, "src")
-            get_repo_files(cfg["url"], v, cfg["working_dir"], version_dir)
+            get_repo_files(cfg["url"], commits[v]["commit"], cfg["working_dir"], version_dir, dest_dir,
+                           fetched_repos=fetched_repos, verbose=verbose)
 
             # get dependencies
-            if "dependencies" in cfg:
-                for dep_url in cfg["dependencies"]:
-                    dep_cfg = cfg["dependencies"][dep_url]
-                    assert "version" in dep_cfg
-                    assert "dir" in dep_cfg
-
-                    dep_version = dep_cfg["version"]
-                    if dep_version == "*":
-                        dep_version = v
+            for (dep_url, dep_commit) in commits[v].get("dependencies", {}).items():
+                dep_dir = os.path.join(lib_tmp_dir, "versions", v, "deps")
+                get_repo_files(dep_url, dep_commit, cfg["dependencies"][dep_url]["dir"], dep_dir, dest_dir,
+                               fetched_repos=fetched_repos, verbose=verbose)
 
-                    dep_dir = os.path.join(lib_tmp_dir, "versions", v, "deps")
-                    get_repo_files(dep_url, dep_version, dep_cfg["dir"], dep_dir)
+            with open(os.path.join(lib_tmp_dir, "versions", v, "commit.json"), "w") as f:
+                json.dump(commits[v], f)
 
         extra_args = []
         if "args" in cfg:
@@ -641,7 +993,23 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
                 assert False, "unknown cpp min version"
 
         for v in cfg["versions"]:
-            for f in files:
+            version_files = files
+            if patterns:
+                src_dir = os.path.join(lib_tmp_dir, "versions", v, "src")
+                dep_dir = os.path.join(lib_tmp_dir, "versions", v, "deps")
+                matched = [f for f in expand_file_patterns(patterns, src_dir) if f not in files]
+
+                # only headers that compile on their own (with the lowest configured standard) become jobs
+                check_cfg = min(cfgs, key=lambda c: c.cpp)
+                rejected = check_self_contained(matched, check_cfg, extra_args, [src_dir, dep_dir], v,
+                                                os.path.join(dest_dir, "header-check-cache.json"), commits=commits[v])
+                print("      {} {}: {} files match, {} rejected as not self-contained".format(
+                    lib, v, len(matched), len(rejected)))
+                for f in sorted(rejected):
+                    print("        rejected {}: {}".format(f, rejected[f]))
+                version_files = files + [f for f in matched if f not in rejected]
+
+            for f in version_files:
                 file_path = os.path.join(lib_tmp_dir, "versions", v, "src", f)
                 if not os.path.exists(file_path):
                     print("missing file " + file_path)
@@ -664,7 +1032,108 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
                 dep_dir = os.path.join(lib_tmp_dir, "versions", v, "deps")
 
                 add(cat, lib, cfg["url"], furl, vname, f, f, cfgs, os.path.join(
-                    lib_tmp_dir, "versions", v), extra_args=extra_args, include_dirs=[src_dir, dep_dir])
+                    lib_tmp_dir, "versions", v), extra_args=extra_args, include_dirs=[src_dir, dep_dir],
+                    link_usage=cfg.get("link_usage"), commit=commits[v]["commit"],
+                    dependency_commits=commits[v].get("dependencies"), prelude=project_prelude(cfg))
+                for (uname, code) in project_usages(cfg, f):
+                    add(cat, lib, cfg["url"], furl, vname, "{} [{}]".format(f, uname), f, cfgs, os.path.join(
+                        lib_tmp_dir, "versions", v), extra_args=extra_args, include_dirs=[src_dir, dep_dir],
+                        usage=code, usage_name=uname, commit=commits[v]["commit"],
+                        dependency_commits=commits[v].get("dependencies"), prelude=project_prelude(cfg))
+
+
+    def add_project_compile_commands(cfg, cat, lib, libpath):
+        assert "compile_commands" in cfg, "project.json needs a path to compile_commands.json"
+
+        cc_path = os.path.join(libpath, os.path.expanduser(cfg["compile_commands"]))
+        assert os.path.exists(cc_path), "cannot find " + cc_path
+        build_dir = os.path.dirname(os.path.abspath(cc_path))
+
+        tus = parse_compile_commands(cc_path)
+        assert len(tus) > 0, "no translation units in " + cc_path
+
+        root = cfg.get("root")
+        if root is not None:
+            root = os.path.normpath(os.path.join(libpath, os.path.expanduser(root)))
+        else:
+            root = os.path.commonpath([os.path.dirname(tu["file"]) for tu in tus])
+        debug_print("      .. {} TUs, headers in {}".format(len(tus), root))
+
+        # TUs with the same standard and defines are merged into one config
+        # (include dirs are unified in order of first appearance)
+        tu_configs = {}
+        for tu in tus:
+            key = (tu["cpp"], tuple(tu["defines"]))
+            if key not in tu_configs:
+                tu_configs[key] = {
+                    "cpp": tu["cpp"],
+                    "defines": tu["defines"],
+                    "include_dirs": [],
+                    "system_include_dirs": [],
+                    "quote_include_dirs": [],
+                    "after_include_dirs": [],
+                    "tu_dirs": set(),
+                    "tu_count": 0,
+                }
+            tc = tu_configs[key]
+            for k in ["include_dirs", "system_include_dirs", "quote_include_dirs", "after_include_dirs"]:
+                for d in tu[k]:
+                    if d not in tc[k]:
+                        tc[k].append(d)
+            tc["tu_dirs"].add(os.path.dirname(tu["file"]))
+            tc["tu_count"] += 1
+        tu_configs = list(tu_configs.values())
+        debug_print("      .. {} distinct configs".format(len(tu_configs)))
+
+        # each header uses the config of the TUs closest to it
+        def config_for(header):
+            hdir = os.path.dirname(header)
+            def closeness(tc):
+                common = max(len(os.path.commonpath([hdir, d])) for d in tc["tu_dirs"])
+                return (common, tc["tu_count"])
+            return max(tu_configs, key=closeness)
+
+        exclude = [re.compile(e) for e in cfg.get("exclude", [])]
+        version = cfg.get("version", "local")
+
+        # the version stays the same while the headers are edited, so results are cached per content revision
+        # of all directories a config can include from (size and mtime of every file, see fingerprints)
+        for tc in tu_configs:
+            h = hashlib.sha1()
+            for k in ["include_dirs", "system_include_dirs", "quote_include_dirs", "after_include_dirs"]:
+                for d in [root] + tc[k]:
+                    h.update(scripts.fingerprints.directory_fingerprint(d).encode("utf-8"))
+            tc["revision"] = h.hexdigest()
+
+        for (dirname, dirs, files) in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and
+                             os.path.abspath(os.path.join(dirname, d)) != build_dir)
+            for f in sorted(files):
+                if os.path.splitext(f)[-1] not in [".h", ".hh", ".hpp", ".hxx", ".h++"]:
+                    continue
+                fpath = os.path.join(dirname, f)
+                rfpath = os.path.relpath(fpath, root)
+                if any(e.search(rfpath) for e in exclude):
+                    debug_print("      " + rfpath + " - IGNORED")
+                    continue
+
+                tc = config_for(fpath)
+                extra_args = list(tc["defines"]) + cfg.get("args", [])
+                for d in tc["system_include_dirs"]:
+                    extra_args += ["-isystem", d]
+                for d in tc["quote_include_dirs"]:
+                    extra_args += ["-iquote", d]
+                for d in tc["after_include_dirs"]:
+                    extra_args += ["-idirafter", d]
+
+                cfgs = [c for c in all_configs if tc["cpp"] is None or c.cpp == tc["cpp"]]
+                if not cfgs:
+                    print("no config for C++{} (used by {}), skipping".format(tc["cpp"], rfpath))
+                    continue
+
+                add(cat, lib, cfg.get("url"), None, version, rfpath, rfpath, cfgs, root,
+                    extra_args=extra_args, include_dirs=[root] + [d for d in tc["include_dirs"] if d != root],
+                    commit=tc["revision"], prelude=project_prelude(cfg))
 
 
     for cat in sorted(os.listdir("libs")):
@@ -700,6 +1169,9 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
             elif cfg["type"] == "gitlab":
                 add_project_git(cfg, cat, lib, libpath, make_gitlab_file_url)
 
+            elif cfg["type"] == "compile_commands":
+                add_project_compile_commands(cfg, cat, lib, libpath)
+
             else:
                 assert False, "unknown project type " + cfg["type"]
 
@@ -709,10 +1181,12 @@ def run(dest_file, dest_dir, project, max_num_configs, verbose):
 
     jobs = []
     for proj in project_list:
-        jobs += sorted(project_jobs[proj], key=lambda j: j["name"])
+        jobs += [j[1:] for j in sorted(project_jobs[proj], key=lambda j: j[0])]
 
-    with open(dest_file, "w") as f:
-        json.dump(jobs, f, indent=4)
+    def values(table):
+        return [v for (_, v) in sorted(table.values(), key=lambda e: e[0])]
+
+    write_jobs(dest_file, values(config_table), values(project_table), values(file_table), jobs)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -726,7 +1200,16 @@ if __name__ == '__main__':
                         help="only generate a limited number of configs")
     parser.add_argument("-d", "--dir", required=True,
                         help="tmp dir where downloaded sources are stored")
+    parser.add_argument("--fetch-ttl", type=float, default=60, metavar="MINUTES",
+                        help="only fetch git repos if the last fetch is older than this (default: 60)")
+    parser.add_argument("--prelude", metavar="FILE",
+                        help="code that precedes every file and the baseline (e.g. a few #includes)")
 
     args = parser.parse_args()
 
-    run(args.file, args.dir, args.project, args.configs, args.verbose)
+    prelude = None
+    if args.prelude:
+        with open(args.prelude, "r") as f:
+            prelude = f.read()
+
+    run(args.file, args.dir, args.project, args.configs, args.verbose, fetch_ttl=args.fetch_ttl, prelude=prelude)
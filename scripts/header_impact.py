@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+
+import scripts.analyze_file
+import scripts.generate_jobs
+
+# number of trailing path components used to match measured headers (e.g. boost/json/value.hpp)
+max_suffix_depth = 4
+
+
+def depfiles_in(directory):
+    for (dirname, _, files) in os.walk(directory):
+        for f in files:
+            if f.endswith(".d"):
+                with open(os.path.join(dirname, f), "r", errors="replace") as fd:
+                    # first dependency is the source itself
+                    yield scripts.analyze_file.parse_depfile(fd.read())[1:]
+
+
+def dependencies_from_compile_commands(path, jobs):
+    def run_dependency_scan(tu):
+        cargs = []
+        skip = False
+        for a in tu["arguments"]:
+            if skip:
+                skip = False
+                continue
+            if a in ["-o", "-MF", "-MT", "-MQ"]:
+                skip = True
+                continue
+            if a in ["-c", "-MD", "-MMD"]:
+                continue
+            cargs.append(a)
+        p = subprocess.run(cargs + ["-M"], cwd=tu["directory"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if p.returncode != 0:
+            print("  .. could not scan " + tu["file"])
+            return []
+        return scripts.analyze_file.parse_depfile(p.stdout.decode("utf-8", errors="replace"))[1:]
+
+    tus = scripts.generate_jobs.parse_compile_commands(path)
+    print("scanning {} translation units with {} jobs".format(len(tus), jobs))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for deps in executor.map(run_dependency_scan, tus):
+            yield deps
+
+
+def load_header_costs(data_file, compiler_name, variant, cpp):
+    # average cost over the baseline (in ms) per header name (of the last listed version)
+    with open(data_file, "r") as f:
+        data = json.load(f)
+
+    columns = data.get("columns", ["variant", "compile_time", "compile_time_base"])
+    ci = columns.index("compile_time")
+    bi = columns.index("compile_time_base")
+
+    variant_ok = []
+    for v in data["variants"]:
+        ok = True
+        if compiler_name is not None and v["compiler_name"] != compiler_name:
+            ok = False
+        if variant is not None and v["name"] != variant:
+            ok = False
+        if cpp is not None and v["cpp"] != cpp:
+            ok = False
+        variant_ok.append(ok)
+
+    costs = {}
+    for p in data["projects"]:
+        for f in p["files"]:
+            ts = [r[ci] - r[bi] for r in f["results"] if variant_ok[r[0]]]
+            if not ts:
+                continue
+            name = f["name"]
+            if name.startswith("<") and name.endswith(">"):
+                name = name[1:-1]
+            costs[name] = {
+                "project": p["name"],
+                "version": p["version"],
+                "cost": sum(ts) / len(ts),
+            }
+    return costs
+
+
+def run(data_file, dest_file, *, depfile_dir=None, compile_commands=None, jobs=None,
+        compiler_name=None, variant=None, cpp=None, top=50):
+
+    assert depfile_dir or compile_commands, "either depfiles or a compile_commands.json are required"
+
+    costs = load_header_costs(data_file, compiler_name, variant, cpp)
+    print("found costs for {} headers".format(len(costs)))
+
+    if depfile_dir:
+        tu_deps = depfiles_in(depfile_dir)
+    else:
+        tu_deps = dependencies_from_compile_commands(compile_commands, jobs or os.cpu_count())
+
+    # count in how many TUs each measured header is (transitively) included
+    counts = {}
+    tu_count = 0
+    for deps in tu_deps:
+        tu_count += 1
+        found = set()
+        for d in deps:
+            parts = os.path.normpath(d).split(os.sep)
+            for n in range(1, min(max_suffix_depth, len(parts)) + 1):
+                suffix = "/".join(parts[-n:])
+                if suffix in costs:
+                    found.add(suffix)
+        for h in found:
+            counts[h] = counts.get(h, 0) + 1
+    print("scanned {} translation units".format(tu_count))
+
+    ranking = []
+    for (h, cnt) in counts.items():
+        c = costs[h]
+        ranking.append({
+            "header": h,
+            "project": c["project"],
+            "version": c["version"],
+            "includes": cnt,
+            "cost": c["cost"],
+            "impact": cnt * c["cost"],
+        })
+    ranking.sort(key=lambda r: -r["impact"])
+
+    print("")
+    print("{:>12} {:>8} {:>10}  header".format("impact [s]", "TUs", "cost [ms]"))
+    for r in ranking if not top else ranking[0:top]:
+        print("{:>12.1f} {:>8} {:>10.1f}  {} ({})".format(
+            r["impact"] / 1000., r["includes"], r["cost"], r["header"], r["project"]))
+
+    if dest_file:
+        with open(dest_file, "w") as f:
+            json.dump({"translation_units": tu_count, "ranking": ranking}, f, indent=4)
+
+    return ranking
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Rank measured headers by their total build-time impact on a codebase")
+    parser.add_argument("data", metavar="D", help="result file (e.g. compile-health-data.json)")
+    parser.add_argument("--depfiles", help="build directory with depfiles (*.d) to scan")
+    parser.add_argument("--compile-commands", help="compile_commands.json to scan (runs the compiler with -M)")
+    parser.add_argument("-j", "--jobs", type=int, help="parallel dependency scans (default: number of cores)")
+    parser.add_argument("--compiler", help="only use costs of this compiler (e.g. 'GCC 9')")
+    parser.add_argument("--variant", help="only use costs of this variant (e.g. Debug)")
+    parser.add_argument("--cpp", type=int, help="only use costs of this C++ version (e.g. 17)")
+    parser.add_argument("--top", type=int, default=50, help="number of headers to print (0 for all)")
+    parser.add_argument("-o", "--json", help="write full ranking to this json file")
+
+    args = parser.parse_args()
+
+    run(args.data, args.json, depfile_dir=args.depfiles, compile_commands=args.compile_commands, jobs=args.jobs,
+        compiler_name=args.compiler, variant=args.variant, cpp=args.cpp, top=args.top)
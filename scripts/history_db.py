@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import json
+import platform
+import sqlite3
+import time
+
+import scripts.execute_jobs
+import scripts.fingerprints
+
+# job fields that are stored as columns (everything measured goes into the result json)
+job_columns = [
+    "cache_key",
+    "category",
+    "project",
+    "project_url",
+    "version",
+    "name",
+    "url",
+    "file",
+    "variant",
+    "cpp",
+    "compiler",
+    "compiler_name",
+    "argstr",
+]
+
+
+def open_db(db_file):
+    db = sqlite3.connect(db_file)
+    db.execute("""CREATE TABLE IF NOT EXISTS measurements (
+        id INTEGER PRIMARY KEY,
+        timestamp REAL NOT NULL,
+        host TEXT NOT NULL,
+        compiler_fingerprint TEXT NOT NULL,
+        {},
+        result TEXT NOT NULL
+    )""".format(",\n        ".join(c + " TEXT" for c in job_columns)))
+    db.execute("CREATE INDEX IF NOT EXISTS idx_key ON measurements (cache_key, timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_project ON measurements (project, version)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_file ON measurements (file)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_compiler ON measurements (compiler)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_variant ON measurements (variant)")
+    return db
+
+
+def add_measurement(db, job, result):
+    values = [time.time(), platform.node(), scripts.fingerprints.compiler_fingerprint(job["compiler"])]
+    values += [job["cache-key"] if c == "cache_key" else job[c] for c in job_columns]
+    values.append(json.dumps(result))
+    db.execute("INSERT INTO measurements (timestamp, host, compiler_fingerprint, {}, result) VALUES ({})".format(
+        ", ".join(job_columns), ", ".join(["?"] * len(values))), values)
+    db.commit()
+
+
+def query_results(db, *, as_of=None, project=None):
+    # yields the latest measurement per cache key (optionally as of a given unix time)
+    # in the order expected by build_result_data
+    conditions = []
+    params = []
+    if as_of is not None:
+        conditions.append("timestamp <= ?")
+        params.append(as_of)
+    if project is not None:
+        conditions.append("project = ?")
+        params.append(project)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    cursor = db.execute("""SELECT m.timestamp, m.host, m.compiler_fingerprint, {}, m.result
+        FROM measurements m
+        JOIN (SELECT cache_key, MAX(timestamp) AS latest FROM measurements {} GROUP BY cache_key) l
+        ON m.cache_key = l.cache_key AND m.timestamp = l.latest
+        ORDER BY m.category, m.project, m.version, m.name, m.compiler, m.argstr""".format(
+        ", ".join("m." + c for c in job_columns), where), params)
+
+    for row in cursor:
+        j = json.loads(row[-1])
+        j["measured_at"] = row[0]
+        j["host"] = row[1]
+        j["compiler_fingerprint"] = row[2]
+        for (c, v) in zip(job_columns, row[3:-1]):
+            j[c] = v
+        j["cpp"] = int(j["cpp"])
+        yield j
+
+
+def parse_date(s):
+    return datetime.datetime.fromisoformat(s).timestamp()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate result data from the C++ compile-health history database")
+    parser.add_argument("db", metavar="DB", help="history database (e.g. history.sqlite)")
+    parser.add_argument("result", metavar="R", help="result file (e.g. data.json)")
+    parser.add_argument("--as-of", type=parse_date,
+                        help="only use measurements up to this date (e.g. 2020-04-01 or 2020-04-01T12:00)")
+    parser.add_argument("-p", "--project", help="only output a specific project")
+
+    args = parser.parse_args()
+
+    db = open_db(args.db)
+    data = scripts.execute_jobs.build_result_data(query_results(db, as_of=args.as_of, project=args.project))
+    with open(args.result, "w") as f:
+        json.dump(data, f)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import time
+
+import scripts.analyze_file
+import scripts.generate_jobs
+
+
+def run(project, dest_dir, *, compiler_name=None, variant="Debug", cpp=None, interval=1.0, verbose=False):
+
+    cfg, cat, libpath = scripts.generate_jobs.find_project_config(project)
+    assert cfg["type"] == "file", "watch mode requires a local project (\"type\": \"file\")"
+
+    config = scripts.generate_jobs.find_config(compiler_name, variant, cpp, cfg.get("min-cpp", 11))
+    print("watching {} with {} {} C++{} (ctrl+c to stop)".format(libpath, config.compiler_name, config.variant, config.cpp))
+
+    # (version, file) -> state of the last measurement
+    headers = {}
+
+    def snapshot():
+        mtimes = {}
+        for (dirname, _, files) in os.walk(libpath):
+            for f in files:
+                fpath = os.path.abspath(os.path.join(dirname, f))
+                mtimes[fpath] = os.stat(fpath).st_mtime_ns
+        return mtimes
+
+    def format_delta(curr, prev, fmt):
+        if prev is None:
+            return ""
+        return " (" + fmt.format(curr - prev) + ")"
+
+    def measure(key, vpath):
+        (v, rfpath) = key
+        h = headers.setdefault(key, {"closure": set(), "result": None, "initial": None})
+        name = rfpath if v == "" else v + "/" + rfpath
+        try:
+            h["closure"] = set(scripts.analyze_file.include_closure(
+                rfpath, [vpath], dest_dir, config.compiler, config.compiler_type, config.args))
+            res = json.loads(scripts.analyze_file.run(rfpath, [vpath], dest_dir, config.compiler, config.compiler_type,
+                                                      config.args, not verbose, verbose))
+        except scripts.analyze_file.CompileError as e:
+            # re-measured as soon as the file itself changes
+            h["closure"].add(os.path.abspath(os.path.join(vpath, rfpath)))
+            errors = [l for l in e.diagnostics.splitlines() if "error" in l]
+            print("  {}: failed ({})".format(name, errors[0] if errors else "unknown error"))
+            return
+
+        ms = 1000 * (res["compile_time"] - res["compile_time_base"])
+        lines = res["line_count"]
+        prev = h["result"]
+        init = h["initial"]
+        print("  {}: {:.1f} ms{}{}, {} lines{}, {} bytes{}".format(
+            name,
+            ms, format_delta(ms, prev and prev[0], "{:+.1f} ms"),
+            format_delta(ms, init and init[0], "{:+.1f} ms since start") if init != prev else "",
+            lines, format_delta(lines, prev and prev[1], "{:+}"),
+            res["object_size"], format_delta(res["object_size"], prev and prev[2], "{:+}")))
+        h["result"] = (ms, lines, res["object_size"])
+        if h["initial"] is None:
+            h["initial"] = h["result"]
+
+    def project_files():
+        return {(v, rfpath): vpath for (v, vpath, rfpath) in scripts.generate_jobs.list_project_files(cfg, libpath)}
+
+    files = project_files()
+    print("measuring {} files".format(len(files)))
+    for key in sorted(files):
+        measure(key, files[key])
+
+    mtimes = snapshot()
+    try:
+        while True:
+            time.sleep(interval)
+            new_mtimes = snapshot()
+            changed = set(p for p in new_mtimes if mtimes.get(p) != new_mtimes[p])
+            changed |= set(p for p in mtimes if p not in new_mtimes)
+            mtimes = new_mtimes
+            if not changed:
+                continue
+
+            files = project_files()
+            for key in list(headers):
+                if key not in files:
+                    print("  {} was removed".format(key[1]))
+                    del headers[key]
+
+            # only headers whose include closure contains a changed file are re-measured
+            affected = [key for key in sorted(files) if key not in headers or headers[key]["closure"] & changed]
+            print("{} changed file(s), re-measuring {} file(s)".format(len(changed), len(affected)))
+            for key in affected:
+                measure(key, files[key])
+    except KeyboardInterrupt:
+        print("stopped watching")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Continuously re-measure the files of a local project when they change")
+    parser.add_argument("project", metavar="P", help="project name (a \"file\" project in libs/)")
+    parser.add_argument("-d", "--dir", required=True,
+                        help="temporary directory to use (e.g. /tmp)")
+    parser.add_argument("--compiler", help="compiler name of the config (e.g. 'GCC 9')")
+    parser.add_argument("--variant", default="Debug", help="variant of the config (default: Debug)")
+    parser.add_argument("--cpp", type=int, help="C++ version of the config (e.g. 17)")
+    parser.add_argument("-i", "--interval", type=float, default=1.0,
+                        help="polling interval in seconds (default: 1)")
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    run(args.project, args.dir, compiler_name=args.compiler, variant=args.variant, cpp=args.cpp,
+        interval=args.interval, verbose=args.verbose)